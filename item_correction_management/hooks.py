@@ -145,6 +145,13 @@ app_license = "gpl-3.0"
 # 	}
 # }
 
+doc_events = {
+	"Fiscal Year": {
+		"on_update": "item_correction_management.utils.clear_fiscal_year_index",
+		"on_trash": "item_correction_management.utils.clear_fiscal_year_index",
+	}
+}
+
 # Scheduled Tasks
 # ---------------
 
@@ -166,6 +173,12 @@ app_license = "gpl-3.0"
 # 	],
 # }
 
+scheduler_events = {
+	"hourly": [
+		"item_correction_management.item_correction_management.doctype.asset_to_stock_item_conversion.asset_to_stock_item_conversion.mark_stale_conversions_failed"
+	],
+}
+
 # Testing
 # -------
 
@@ -0,0 +1,20 @@
+// Copyright (c) 2025, Ahmad Zubair Amini and contributors
+// For license information, please see license.txt
+
+frappe.ui.form.on("Asset to Stock Conversion Batch", {
+	refresh(frm) {
+		if (frm.doc.docstatus === 0) {
+			frm.add_custom_button(__("Get Items"), () => {
+				frm.call({
+					doc: frm.doc,
+					method: "get_items",
+					freeze: true,
+					callback: () => {
+						frm.refresh_field("items");
+						frm.dirty();
+					},
+				});
+			});
+		}
+	},
+});
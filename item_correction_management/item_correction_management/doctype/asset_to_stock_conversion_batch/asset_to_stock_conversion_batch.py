@@ -0,0 +1,205 @@
+# Copyright (c) 2025, Ahmad Zubair Amini and contributors
+# For license information, please see license.txt
+
+# Batch Asset to Stock Conversion DocType
+import frappe
+from frappe.model.document import Document
+from frappe import _
+
+from item_correction_management.item_correction_management.doctype.asset_to_stock_item_conversion.asset_to_stock_item_conversion import (
+    ProcessedLogs,
+    run_conversion,
+)
+from item_correction_management.utils import allow_update_to_disabled_doc
+
+BATCH_ITEM_DOCTYPE = "Asset to Stock Conversion Batch Item"
+METRIC_DOCTYPE = "Asset to Stock Conversion Metric"
+DEFAULT_CHUNK_SIZE = 50
+
+
+class AssettoStockConversionBatch(Document):
+
+    def validate(self):
+        # Fill row defaults from the batch header
+        seen = set()
+        for row in self.items:
+            if row.item_name in seen:
+                frappe.throw(
+                    _("Row {0}: Item {1} is listed more than once.").format(
+                        row.idx, row.item_name
+                    )
+                )
+            seen.add(row.item_name)
+
+            row.asset_category = row.asset_category or self.asset_category
+            row.asset_account = row.asset_account or self.asset_account
+
+            if not row.asset_category or not row.asset_account:
+                frappe.throw(
+                    _("Row {0}: Asset Category and Asset Account are required.").format(
+                        row.idx
+                    )
+                )
+
+    @frappe.whitelist()
+    def get_items(self):
+        # Fill the items table from the header filters
+        filters = {"is_fixed_asset": 1, "disabled": 0}
+        if self.asset_category:
+            filters["asset_category"] = self.asset_category
+        if self.item_group:
+            filters["item_group"] = self.item_group
+
+        existing = {row.item_name for row in self.items}
+        for item in frappe.get_all(
+            "Item", filters=filters, fields=["name", "asset_category"], order_by="name"
+        ):
+            if item.name in existing:
+                continue
+
+            self.append(
+                "items",
+                {
+                    "item_name": item.name,
+                    "asset_category": self.asset_category or item.asset_category,
+                    "asset_account": self.asset_account,
+                },
+            )
+
+    def on_submit(self):
+        # Fan the items out to chunked background jobs on the long queue
+        row_names = [row.name for row in self.items]
+        chunk_size = self.chunk_size or DEFAULT_CHUNK_SIZE
+        if self.parallel_jobs:
+            # Spread items round-robin so every lane gets a similar share.
+            # A lane runs its chunks one after another, so at most
+            # `parallel_jobs` chunks run at once.
+            jobs = self.parallel_jobs
+            lanes = [
+                split_chunks(row_names[job::jobs], chunk_size) for job in range(jobs)
+            ]
+        else:
+            # Every chunk is its own lane, picked up by any free worker
+            lanes = [[chunk] for chunk in split_chunks(row_names, chunk_size)]
+
+        frappe.db.set_value(
+            BATCH_ITEM_DOCTYPE, {"parent": self.name}, "status", "Queued"
+        )
+
+        for chunks in filter(None, lanes):
+            enqueue_batch_chunks(
+                self.name,
+                chunks,
+                set_based=self.set_based_gl_rewrite,
+                commit_every=self.commit_every if self.resumable else None,
+            )
+
+        frappe.msgprint(
+            _("{0} items queued for conversion.").format(len(row_names)), alert=True
+        )
+
+
+def split_chunks(row_names, chunk_size):
+    return [
+        row_names[start : start + chunk_size]
+        for start in range(0, len(row_names), chunk_size)
+    ]
+
+
+def enqueue_batch_chunks(batch, chunks, set_based=False, commit_every=None):
+    # Queue the first chunk; it queues the rest of its lane when it ends
+    frappe.enqueue(
+        process_batch_chunk,
+        queue="long",
+        timeout=6000,
+        enqueue_after_commit=True,
+        batch=batch,
+        rows=chunks[0],
+        set_based=set_based,
+        commit_every=commit_every,
+        next_chunks=chunks[1:],
+    )
+
+
+def process_batch_chunk(
+    batch, rows, set_based=False, commit_every=None, next_chunks=None
+):
+    # Convert the chunk, then queue the next chunk of the same lane
+    try:
+        convert_batch_rows(batch, rows, set_based, commit_every)
+    finally:
+        if next_chunks:
+            enqueue_batch_chunks(batch, next_chunks, set_based, commit_every)
+            frappe.db.commit()
+
+
+def convert_batch_rows(batch, rows, set_based=False, commit_every=None):
+    # Convert each item of the chunk and record its status on the batch row
+    batch_rows = {
+        row.name: row
+        for row in frappe.get_all(
+            BATCH_ITEM_DOCTYPE,
+            filters={"name": ["in", rows]},
+            fields=["name", "item_name", "asset_category", "asset_account", "status"],
+        )
+    }
+    # Processed logs of the whole chunk, loaded once to skip converted items.
+    # Anything else is re-checked by run_conversion once the item is locked.
+    processed_logs = ProcessedLogs([row.item_name for row in batch_rows.values()])
+
+    # Updates to disabled docs are allowed for the whole chunk
+    with allow_update_to_disabled_doc():
+        for row_name in rows:
+            row = batch_rows.get(row_name)
+            if not row or row.status == "Completed":
+                continue
+
+            metrics = []
+            try:
+                if processed_logs.is_converted(
+                    row.item_name, row.asset_category, row.asset_account
+                ):
+                    results = [_("✅ Already processed.")]
+                else:
+                    results = run_conversion(
+                        row.item_name,
+                        row.asset_category,
+                        row.asset_account,
+                        set_based=set_based,
+                        commit_every=commit_every,
+                        metrics=metrics,
+                    )
+                status = "Failed" if any("❌" in r for r in results) else "Completed"
+                message = "\n".join(results)
+
+            except Exception as e:
+                frappe.db.rollback()
+                frappe.log_error(
+                    frappe.get_traceback(), f"Asset to Stock Batch {batch}"
+                )
+                status = "Failed"
+                message = str(e)
+
+            frappe.db.set_value(
+                BATCH_ITEM_DOCTYPE,
+                row_name,
+                {"status": status, "message": message},
+                update_modified=False,
+            )
+            insert_batch_metrics(batch, row.item_name, metrics)
+            frappe.db.commit()
+
+
+def insert_batch_metrics(batch, item_name, metrics):
+    # Stage metrics of one item, added to the submitted batch
+    for stage_metrics in metrics:
+        frappe.get_doc(
+            {
+                "doctype": METRIC_DOCTYPE,
+                "parent": batch,
+                "parenttype": "Asset to Stock Conversion Batch",
+                "parentfield": "metrics",
+                "item_name": item_name,
+                **stage_metrics,
+            }
+        ).db_insert()
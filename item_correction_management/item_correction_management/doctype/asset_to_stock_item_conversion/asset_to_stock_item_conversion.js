@@ -1,8 +1,103 @@
 // Copyright (c) 2025, Ahmad Zubair Amini and contributors
 // For license information, please see license.txt
 
-// frappe.ui.form.on("Asset to Stock Item Conversion", {
-// 	refresh(frm) {
+frappe.ui.form.on("Asset to Stock Item Conversion", {
+	setup(frm) {
+		frappe.realtime.off("asset_to_stock_conversion_progress");
+		frappe.realtime.on("asset_to_stock_conversion_progress", (data) => {
+			if (data.name !== frm.doc.name) return;
 
-// 	},
-// });
+			frm.dashboard.show_progress(
+				__("Conversion"),
+				(data.done / data.total) * 100,
+				__(data.stage)
+			);
+
+			if (data.done === data.total) {
+				frm.dashboard.hide_progress();
+				frm.reload_doc();
+			}
+		});
+	},
+
+	refresh(frm) {
+		const indicators = {
+			Queued: "orange",
+			Running: "blue",
+			Failed: "red",
+			Done: "green",
+		};
+		if (frm.doc.docstatus === 1 && indicators[frm.doc.status]) {
+			frm.page.set_indicator(__(frm.doc.status), indicators[frm.doc.status]);
+		}
+
+		const stale_job = frm.doc.__onload && frm.doc.__onload.stale_job;
+		if (stale_job) {
+			frm.dashboard.set_headline(
+				__("The conversion job stopped before finishing. Re-run it to resume."),
+				"red"
+			);
+		}
+
+		if (frm.doc.docstatus === 1 && (frm.doc.status === "Failed" || stale_job)) {
+			frm.add_custom_button(__("Re-run"), () => {
+				frm.call({
+					doc: frm.doc,
+					method: "rerun",
+					freeze: true,
+					callback: () => frm.reload_doc(),
+				});
+			});
+		}
+
+		if (frm.doc.docstatus === 1 && frm.doc.status === "Done") {
+			frm.add_custom_button(__("Verify Balances"), () => {
+				frappe.call({
+					method: "item_correction_management.item_correction_management.doctype.asset_to_stock_item_conversion.asset_to_stock_item_conversion.verify_conversion_balances",
+					args: { item_name: frm.doc.item_name },
+					freeze: true,
+					callback: (r) => show_verification(r.message),
+				});
+			});
+		}
+	},
+});
+
+function show_verification(result) {
+	if (result.balanced) {
+		frappe.msgprint({
+			title: __("Verification"),
+			indicator: "green",
+			message: __("All vouchers touched by the conversion balance."),
+		});
+		return;
+	}
+
+	const lines = [
+		...result.missing_accounts.map((account) =>
+			__("Account {0} does not exist", [account])
+		),
+		...result.unbalanced_vouchers.map((row) =>
+			__("{0} {1} is unbalanced by {2} / {3} / {4} (base / account / transaction currency)", [
+				row.voucher_type,
+				row.voucher_no,
+				row.difference,
+				row.difference_in_account_currency,
+				row.difference_in_transaction_currency,
+			])
+		),
+		...result.stock_mismatches.map((row) =>
+			__("Purchase Receipt {0}: stock value {1}, Stock In Hand GL {2}", [
+				row.voucher_no,
+				row.stock_value,
+				row.gl_value,
+			])
+		),
+	];
+
+	frappe.msgprint({
+		title: __("Verification"),
+		indicator: "red",
+		message: lines.join("<br>"),
+	});
+}
@@ -2,209 +2,627 @@
 # For license information, please see license.txt
 
 # Asset to Stock Conversion Tool DocType
+import cProfile
+import io
+import marshal
+import pstats
+from collections import Counter, defaultdict
+from functools import cached_property
+
 import frappe
 from frappe.model.document import Document
-from frappe.utils import now, get_datetime
-from frappe.model.naming import make_autoname
+from frappe.model.meta import get_field_precision
+from frappe.utils import flt, now, get_datetime, today
+from frappe.utils.background_jobs import is_job_enqueued
 from frappe import _
 
+from item_correction_management.utils import (
+    AdvisoryLocks,
+    SeriesAllocator,
+    allow_update_to_disabled_doc,
+    StageMetrics,
+    get_fiscal_year_index,
+)
+
+STOCK_IN_HAND_ACCOUNT = "Stock In Hand - AOGC"
+SRBNB_ACCOUNT = "Stock Received But Not Billed - AOGC"
+ARBNB_ACCOUNT = "Asset Received But Not Billed - AOGC"
+
+RECEIPT_STOCK_LINES_SOURCE = """
+    FROM `tabPurchase Receipt Item` pri
+    LEFT JOIN `tabPurchase Receipt` pr ON pri.parent = pr.name
+    WHERE pri.item_code = %s AND pri.item_name = %s
+      AND pr.docstatus = 1 AND pri.warehouse IS NOT NULL
+"""
+
+RECEIPT_STOCK_LINES_QUERY = f"""
+    SELECT pri.name, pri.parent, pri.item_code, pri.warehouse, pri.qty,
+           pri.conversion_factor, pri.valuation_rate, pri.stock_uom, pri.batch_no,
+           pri.serial_no, pr.posting_date, pr.posting_time, pr.owner,
+           pr.business_category, pr.branch, pr.project, pr.docstatus, pr.company
+    {RECEIPT_STOCK_LINES_SOURCE}
+      AND pri.item_code IN (SELECT name FROM `tabItem` WHERE is_stock_item = 1)
+      AND pri.name > %s
+    ORDER BY pri.name
+    LIMIT %s
+"""
+
+# Lines and warehouses the item stage will write, counted before the item
+# becomes a stock item
+RECEIPT_STOCK_LINES_COUNT_QUERY = f"""
+    SELECT COUNT(*), COUNT(DISTINCT pri.warehouse)
+    {RECEIPT_STOCK_LINES_SOURCE}
+"""
+
+# Submitted vouchers of one item and their lines, for ConversionSnapshot
+SNAPSHOT_HEADERS_QUERY = """
+    SELECT name, posting_date, posting_time, owner, business_category, branch,
+           project, company, currency, cost_center, IFNULL(conversion_rate, 1),
+           supplier, docstatus
+    FROM `tab{doctype}`
+    WHERE docstatus = 1
+      AND name IN (SELECT parent FROM `tab{doctype} Item` WHERE item_name = %s)
+"""
+
+SNAPSHOT_LINES_QUERY = """
+    SELECT name, parent, item_code, warehouse, qty, conversion_factor,
+           valuation_rate, stock_uom, batch_no, serial_no, asset_category,
+           IFNULL(amount, 0), IFNULL(base_amount, IFNULL(amount, 0))
+    FROM `tab{doctype} Item`
+    WHERE item_name = %s
+      AND parent IN (SELECT name FROM `tab{doctype}` WHERE docstatus = 1)
+    ORDER BY parent, name
+"""
+
+STOCK_LEDGER_TAIL_QUERY = """
+    SELECT name, warehouse, actual_qty, incoming_rate
+    FROM `tabStock Ledger Entry`
+    WHERE item_code = %(item_code)s AND warehouse = %(warehouse)s
+      AND docstatus = 1
+      AND (posting_date > %(posting_date)s
+        OR (posting_date = %(posting_date)s AND posting_time >= %(posting_time)s))
+    ORDER BY posting_date, posting_time, name
+"""
+
+# The replay's running (qty, value) after an entry. The running value is
+# carried even where qty reaches zero and the stored stock_value is 0, so it
+# is recovered from the entry's stock_value_difference rather than read off.
+PREVIOUS_STOCK_BALANCE_QUERY = """
+    SELECT qty_after_transaction,
+           stock_value - stock_value_difference + actual_qty * incoming_rate
+    FROM `tabStock Ledger Entry`
+    WHERE item_code = %(item_code)s AND warehouse = %(warehouse)s
+      AND docstatus = 1
+      AND (posting_date < %(posting_date)s
+        OR (posting_date = %(posting_date)s AND posting_time < %(posting_time)s))
+    ORDER BY posting_date DESC, posting_time DESC, name DESC
+    LIMIT 1
+"""
+
+# GL Entries of a batch of vouchers on the accounts a stage rewrites
+VOUCHER_GL_ACCOUNTS_QUERY = """
+    SELECT DISTINCT voucher_no, account
+    FROM `tabGL Entry`
+    WHERE voucher_no IN %(voucher_nos)s AND account IN %(accounts)s
+"""
+
+VOUCHER_GL_ROWS_QUERY = """
+    SELECT voucher_no, account, against, COUNT(*)
+    FROM `tabGL Entry`
+    WHERE voucher_no IN %(voucher_nos)s AND account IN %(accounts)s
+    GROUP BY voucher_no, account, against
+"""
+
+# Add or subtract one voucher's item amounts on one debit or credit side
+VOUCHER_GL_ADJUST_QUERY = """
+    UPDATE `tabGL Entry`
+    SET
+        {column} = {column} {sign} %s,
+        {column}_in_account_currency = {column}_in_account_currency {sign} %s,
+        {column}_in_transaction_currency = {column}_in_transaction_currency {sign} %s
+    WHERE voucher_no = %s AND {where}
+"""
+
+INVOICE_AGAINST_UPDATE_QUERY = """
+    UPDATE `tabGL Entry`
+    SET against = %(against)s
+    WHERE voucher_type = 'Purchase Invoice' AND voucher_no IN %(voucher_nos)s
+"""
+
+# The item's vouchers that also have lines of other items
+SHARED_VOUCHERS_QUERY = """
+    SELECT DISTINCT own.parent
+    FROM `tab{child_doctype}` own
+    JOIN `tab{child_doctype}` other
+        ON other.parent = own.parent AND other.item_code != own.item_code
+    WHERE own.item_name = %s
+"""
+
+# Touched vouchers of one type whose debits and credits differ
+UNBALANCED_VOUCHERS_QUERY = """
+    SELECT
+        voucher_no,
+        SUM(debit) - SUM(credit) AS difference,
+        SUM(debit_in_account_currency) - SUM(credit_in_account_currency)
+            AS difference_in_account_currency,
+        SUM(debit_in_transaction_currency) - SUM(credit_in_transaction_currency)
+            AS difference_in_transaction_currency
+    FROM `tabGL Entry`
+    WHERE voucher_type = %(voucher_type)s AND is_cancelled = 0
+      AND voucher_no IN (
+        SELECT parent FROM `tab{voucher_type} Item` WHERE item_name = %(item_name)s
+      )
+    GROUP BY voucher_no
+    HAVING ABS(difference) >= %(tolerance)s
+        OR ABS(difference_in_account_currency) >= %(tolerance)s
+        OR ABS(difference_in_transaction_currency) >= %(tolerance)s
+    ORDER BY voucher_no
+"""
+
+# Touched receipts whose stock ledger value differs from their stock GL
+STOCK_GL_MISMATCH_QUERY = """
+    SELECT sle.voucher_no, sle.stock_value, IFNULL(gle.gl_value, 0) AS gl_value
+    FROM (
+        SELECT voucher_no, SUM(stock_value_difference) AS stock_value
+        FROM `tabStock Ledger Entry`
+        WHERE voucher_type = 'Purchase Receipt' AND is_cancelled = 0
+          AND voucher_no IN (
+            SELECT parent FROM `tabPurchase Receipt Item` WHERE item_name = %(item_name)s
+          )
+        GROUP BY voucher_no
+    ) sle
+    LEFT JOIN (
+        SELECT voucher_no, SUM(debit) - SUM(credit) AS gl_value
+        FROM `tabGL Entry`
+        WHERE voucher_type = 'Purchase Receipt' AND account = %(account)s
+          AND is_cancelled = 0
+          AND voucher_no IN (
+            SELECT parent FROM `tabPurchase Receipt Item` WHERE item_name = %(item_name)s
+          )
+        GROUP BY voucher_no
+    ) gle ON gle.voucher_no = sle.voucher_no
+    WHERE ABS(sle.stock_value - IFNULL(gle.gl_value, 0)) >= %(tolerance)s
+    ORDER BY sle.voucher_no
+"""
+
+# Functions listed in the profile summary of a profiled conversion
+PROFILE_TOP_N = 30
+
+# Rows deleted per statement when removing an item's assets
+ASSET_DELETE_CHUNK_SIZE = 500
+
+ASSET_DEPENDENT_DOCTYPES = (
+    "Asset Activity",
+    "Asset Depreciation Schedule",
+    "Asset Movement Item",
+)
+
+# Vouchers per GL Entry existence lookup
+GL_LOOKUP_CHUNK_SIZE = 1000
+
+# Seconds a GL stage waits for a shared voucher locked by a parallel lane
+VOUCHER_LOCK_TIMEOUT = 600
+
+# Vouchers per CASE UPDATE in the set-based GL rewrite
+GL_DELTA_BATCH_SIZE = 500
+
+# voucher_type of the item stage's Asset to Stock Processed log. The item
+# stage covers every category and account, which the log records as
+# ITEM_STAGE_KEY: its key fields are mandatory, and NULLs would slip past
+# the unique constraint.
+ITEM_STAGE_VOUCHER_TYPE = "Item"
+ITEM_STAGE_KEY = "All"
+
+# Fields that identify an Asset to Stock Processed log
+PROCESSED_LOG_KEYS = ("item_name", "asset_category", "asset_account", "voucher_type")
+
+# Bins per INSERT ... ON DUPLICATE KEY UPDATE
+BIN_UPSERT_BATCH_SIZE = 500
+
+# Bin quantities that start at zero on a new Bin
+BIN_ZERO_QTY_FIELDS = (
+    "reserved_qty",
+    "reserved_qty_for_production",
+    "reserved_qty_for_sub_contract",
+    "reserved_qty_for_production_plan",
+    "reserved_stock",
+    "indented_qty",
+    "ordered_qty",
+)
+BIN_ZERO_QTY_VALUES = (0,) * len(BIN_ZERO_QTY_FIELDS)
+
+# Column order of the Bin upsert
+BIN_FIELDS = (
+    "name",
+    "creation",
+    "modified",
+    "owner",
+    "modified_by",
+    "item_code",
+    "warehouse",
+    "stock_uom",
+    "actual_qty",
+    *BIN_ZERO_QTY_FIELDS,
+    "projected_qty",
+    "valuation_rate",
+    "stock_value",
+)
+
+# Purchase Receipt Items fetched per query when streaming SLE source rows
+RECEIPT_LINE_FETCH_SIZE = 2000
+
+# Multi-row INSERT size used by the bulk Stock Ledger Entry writer
+SLE_INSERT_BATCH_SIZE = 1000
+
+# Rows per CASE-based UPDATE when writing revalued ledger entries back
+SLE_UPDATE_BATCH_SIZE = 500
+
+SLE_VALUATION_FIELDS = (
+    "qty_after_transaction",
+    "valuation_rate",
+    "stock_value",
+    "stock_value_difference",
+)
+
+SLE_FIELDS = (
+    "name",
+    "creation",
+    "modified",
+    "modified_by",
+    "owner",
+    "docstatus",
+    "item_code",
+    "warehouse",
+    "posting_date",
+    "posting_time",
+    "posting_datetime",
+    "actual_qty",
+    "voucher_type",
+    "voucher_no",
+    "voucher_detail_no",
+    "incoming_rate",
+    "outgoing_rate",
+    "company",
+    "stock_uom",
+    "batch_no",
+    "serial_no",
+    "is_cancelled",
+    "business_category",
+    "branch",
+    "project",
+    "qty_after_transaction",
+    "valuation_rate",
+    "stock_value",
+    "stock_value_difference",
+    "fiscal_year",
+)
+
 
 class AssettoStockItemConversion(Document):
 
+    def onload(self):
+        self.set_onload("stale_job", self.has_stale_job())
+
     def on_submit(self):
-        # Run all conversion functions when form is submitted
-        results = []
+        # The conversion runs in a background job once the submit is committed
+        self.enqueue_conversion()
+        frappe.msgprint(
+            _("Conversion queued. Progress is shown on this form."), alert=True
+        )
 
-        # 1. Convert the item from asset to stock
-        item_result = update_asset_to_stock_item(self.item_name)
-        results.append(f"Item Conversion: {item_result}")
+    @property
+    def job_id(self):
+        return f"asset_to_stock_conversion::{self.name}"
 
-        # 2. Update Purchase Receipt GL entries
-        pr_result = update_receipt_gl_convert_asset_to_stock(
-            self.item_name, self.asset_category, self.asset_account
+    def enqueue_conversion(self):
+        self.db_set("status", "Queued")
+        frappe.enqueue(
+            run_conversion_job,
+            queue="long",
+            timeout=6000,
+            enqueue_after_commit=True,
+            job_id=self.job_id,
+            deduplicate=True,
+            conversion=self.name,
         )
-        results.append(f"Purchase Receipt GL Updates: {pr_result}")
 
-        # 3. Update Purchase Invoice GL entries
-        pi_result = update_invoice_gl_convert_asset_to_stock(
-            self.item_name, self.asset_category, self.asset_account
+    def has_stale_job(self):
+        # Queued or Running, but its job timed out or its worker died
+        return self.status in ("Queued", "Running") and not is_job_enqueued(
+            self.job_id
         )
-        results.append(f"Purchase Invoice GL Updates: {pi_result}")
 
-        # Show summary of all operations
-        frappe.msgprint("<br>".join(results))
+    def mark_stale_job_failed(self):
+        message = _(
+            "❌ The conversion job stopped before finishing. Re-run it to resume"
+            " from the completed stages."
+        )
+        self.db_set(
+            {
+                "status": "Failed",
+                "result": "\n".join(filter(None, (self.result, message))),
+            }
+        )
+        self.publish_progress(_("Failed"), 1, 1)
 
+    @frappe.whitelist()
+    def rerun(self):
+        # Queue the conversion again after it failed or its job went stale
+        self.check_permission("submit")
+        if self.status == "Done":
+            frappe.throw(_("The conversion is already done."))
+        if self.status in ("Queued", "Running") and not self.has_stale_job():
+            frappe.throw(_("The conversion is still queued or running."))
 
-@frappe.whitelist()
-def update_asset_to_stock_item(item_name):
-    try:
-        # Check if already processed
-        if frappe.db.exists(
-            "Asset to Stock Processed",
-            {
-                "item_name": item_name,
-            },
-        ):
-            return _("✅ Already processed.")
+        self.enqueue_conversion()
 
-        frappe.db.set_single_value("System Settings", "allow_update_to_disabled_doc", 1)
-        frappe.db.sql("SET SQL_SAFE_UPDATES = 0")
+    def execute_conversion(self):
+        # Run all conversion functions, reporting progress to the form
+        self.db_set("status", "Running", commit=True)
+        self.publish_progress(_("Starting"), 0)
 
-        # Update tabItem
-        frappe.db.set_value(
-            "Item",
-            item_name,
+        metrics = []
+        profiler = cProfile.Profile() if self.enable_profiling else None
+        if profiler:
+            profiler.enable()
+
+        try:
+            results = run_conversion(
+                self.item_name,
+                self.asset_category,
+                self.asset_account,
+                set_based=self.set_based_gl_rewrite,
+                commit_every=self.commit_every if self.resumable else None,
+                metrics=metrics,
+                progress=self.publish_progress,
+                trace_memory=self.enable_profiling,
+            )
+            status = "Failed" if any("❌" in r for r in results) else "Done"
+
+        except Exception as e:
+            frappe.db.rollback()
+            frappe.log_error(frappe.get_traceback(), "Asset to Stock Conversion Job")
+            results = [f"❌ {e}"]
+            status = "Failed"
+
+        finally:
+            if profiler:
+                profiler.disable()
+
+        if profiler:
+            self.attach_profile(profiler)
+
+        # Child rows added after the parent is saved are inserted directly
+        for stage_metrics in metrics:
+            self.append("metrics", stage_metrics).db_insert()
+
+        # Keep the summary of all operations on the document
+        self.db_set({"status": status, "result": "\n".join(results)})
+        frappe.db.commit()
+        self.publish_progress(_("Finished"), 1, 1)
+
+    def publish_progress(self, stage, done, total=3):
+        frappe.publish_realtime(
+            "asset_to_stock_conversion_progress",
             {
-                "is_fixed_asset": 0,
-                "auto_create_assets": 0,
-                "asset_category": None,
-                "asset_naming_series": None,
-                "custom_is_service": 0,
-                "is_stock_item": 1,
+                "name": self.name,
+                "stage": stage,
+                "done": done,
+                "total": total,
+                "status": self.status,
             },
+            doctype=self.doctype,
+            docname=self.name,
         )
 
-        # Update Purchase Order Item
-        frappe.db.sql(
-            """
-            UPDATE `tabPurchase Order Item`
-            SET is_fixed_asset = 0
-            WHERE item_code = %s AND item_name = %s
-        """,
-            (item_name, item_name),
-        )
+    def attach_profile(self, profiler):
+        # Attach the raw profile as a .prof file and keep a top-N summary
+        summary = io.StringIO()
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_TOP_N)
+
+        frappe.get_doc(
+            {
+                "doctype": "File",
+                "file_name": f"{self.name}.prof",
+                "attached_to_doctype": self.doctype,
+                "attached_to_name": self.name,
+                "is_private": 1,
+                # Same format as pstats.Stats.dump_stats, loadable with pstats/snakeviz
+                "content": marshal.dumps(stats.stats),
+            }
+        ).save(ignore_permissions=True)
+
+        self.db_set("profile_summary", summary.getvalue())
 
-        # Delete from dependent tables
-        asset_names = frappe.get_all(
-            "Asset", filters={"item_code": item_name}, pluck="name"
+
+def run_conversion_job(conversion):
+    frappe.get_doc("Asset to Stock Item Conversion", conversion).execute_conversion()
+
+
+def mark_stale_conversions_failed():
+    # Hourly: fail conversions whose job was killed, so their owners see it
+    for name in frappe.get_all(
+        "Asset to Stock Item Conversion",
+        filters={"docstatus": 1, "status": ["in", ["Queued", "Running"]]},
+        pluck="name",
+    ):
+        conversion = frappe.get_doc("Asset to Stock Item Conversion", name)
+        if conversion.has_stale_job():
+            conversion.mark_stale_job_failed()
+            frappe.db.commit()
+
+
+def run_conversion(
+    item_name,
+    asset_category,
+    asset_account,
+    set_based=False,
+    commit_every=None,
+    metrics=None,
+    progress=None,
+    trace_memory=False,
+):
+    """Run the item, receipt GL and invoice GL stages for one item.
+
+    Returns the per-stage result messages in the order the stages ran.
+    When `metrics` is a list, a StageMetrics dict is appended to it for
+    every stage, with Python memory traced if `trace_memory` is set.
+    `commit_every` makes the GL stages commit and checkpoint after that
+    many vouchers so a failed run can be resumed. `progress` is called
+    as `progress(stage, done, total)` before every stage.
+    The item's processed logs are loaded once the item is locked, so
+    they can't be stale, and shared by all stages. The GL stages also
+    share a ConversionSnapshot of its purchase documents; the item stage
+    streams its receipt lines instead, so SLE creation stays flat in
+    memory.
+    """
+    results = []
+
+    # Only one job may convert an item at a time, across all workers
+    with AdvisoryLocks([f"item:{item_name}"]), allow_update_to_disabled_doc():
+        processed_logs = ProcessedLogs([item_name])
+        gl_args = (item_name, asset_category, asset_account)
+        gl_kwargs = {
+            "set_based": set_based,
+            "commit_every": commit_every,
+            "processed_logs": processed_logs,
+            "snapshot": ConversionSnapshot(item_name),
+        }
+        stages = (
+            # 1. Convert the item from asset to stock
+            (
+                "Item Conversion",
+                convert_item_to_stock,
+                (item_name,),
+                {"processed_logs": processed_logs},
+            ),
+            # 2. Update Purchase Receipt GL entries
+            (
+                "Purchase Receipt GL Updates",
+                update_receipt_gl_convert_asset_to_stock,
+                gl_args,
+                gl_kwargs,
+            ),
+            # 3. Update Purchase Invoice GL entries
+            (
+                "Purchase Invoice GL Updates",
+                update_invoice_gl_convert_asset_to_stock,
+                gl_args,
+                gl_kwargs,
+            ),
         )
 
-        if asset_names:
-            frappe.db.delete("Asset Activity", {"asset": ["in", asset_names]})
-            frappe.db.delete(
-                "Asset Depreciation Schedule", {"asset": ["in", asset_names]}
+        for idx, (label, stage, args, kwargs) in enumerate(stages):
+            if progress:
+                progress(label, idx, len(stages))
+
+            if metrics is None:
+                result = stage(*args, **kwargs)
+            else:
+                with StageMetrics(label, trace_memory) as stage_metrics:
+                    result = stage(*args, **kwargs)
+                metrics.append(stage_metrics.as_dict())
+
+            results.append(f"{label}: {result}")
+
+    return results
+
+
+@frappe.whitelist()
+def update_asset_to_stock_item(item_name):
+    # Public entry point; options and shared state are for internal callers
+    return convert_item_to_stock(item_name)
+
+
+def convert_item_to_stock(
+    item_name,
+    asset_delete_chunk_size=ASSET_DELETE_CHUNK_SIZE,
+    commit_asset_chunks=False,
+    processed_logs=None,
+):
+    try:
+        # Check if already processed
+        if processed_logs is None:
+            already_processed = frappe.db.exists(
+                "Asset to Stock Processed",
+                {
+                    "item_name": item_name,
+                },
             )
-            frappe.db.delete("Asset Movement Item", {"asset": ["in", asset_names]})
-            frappe.db.delete(
-                "Journal Entry Account",
-                {"reference_type": "Asset", "reference_name": ["in", asset_names]},
+        else:
+            already_processed = item_name in processed_logs
+
+        if already_processed:
+            return _("✅ Already processed.")
+
+        # Name blocks for the SLEs and Bins, reserved and committed before
+        # the first write so tabSeries is not locked for the whole stage
+        line_count, warehouse_count = frappe.db.sql(
+            RECEIPT_STOCK_LINES_COUNT_QUERY, (item_name, item_name)
+        )[0]
+        sle_names = SeriesAllocator("SLE-", line_count, commit=True)
+        bin_names = SeriesAllocator("BIN-", warehouse_count, commit=True)
+
+        # Conversion writes run with updates to disabled docs allowed
+        with allow_update_to_disabled_doc():
+            frappe.db.sql("SET SQL_SAFE_UPDATES = 0")
+
+            # Update tabItem
+            frappe.db.set_value(
+                "Item",
+                item_name,
+                {
+                    "is_fixed_asset": 0,
+                    "auto_create_assets": 0,
+                    "asset_category": None,
+                    "asset_naming_series": None,
+                    "custom_is_service": 0,
+                    "is_stock_item": 1,
+                },
             )
 
-            # Delete orphan Journal Entries
+            # Update Purchase Order Item
             frappe.db.sql(
                 """
-                DELETE FROM `tabJournal Entry`
-                WHERE name NOT IN (SELECT parent FROM `tabJournal Entry Account`)
-            """
+                UPDATE `tabPurchase Order Item`
+                SET is_fixed_asset = 0
+                WHERE item_code = %s AND item_name = %s
+            """,
+                (item_name, item_name),
             )
 
-            frappe.db.delete("Asset", {"name": ["in", asset_names]})
-
-        # Get Purchase Receipt Items
-        pri = frappe.db.sql(
-            """
-            SELECT pri.*, pr.posting_date, pr.posting_time, pr.owner, pr.business_category, pr.branch, 
-                   pr.project, pr.docstatus, fy.name AS fiscal_year,pr.company
-            FROM `tabPurchase Receipt Item` pri
-            LEFT JOIN `tabPurchase Receipt` pr ON pri.parent = pr.name
-            LEFT JOIN `tabFiscal Year` fy 
-                ON pr.posting_date BETWEEN fy.year_start_date AND fy.year_end_date
-            WHERE pri.item_code = %s AND pri.item_name = %s
-              AND pr.docstatus = 1 AND pri.warehouse IS NOT NULL
-              AND pri.item_code IN (SELECT name FROM `tabItem` WHERE is_stock_item = 1)
-        """,
-            (item_name, item_name),
-            as_dict=True,
-        )
+            # Delete the item's assets and their dependent rows
+            asset_names = frappe.get_all(
+                "Asset", filters={"item_code": item_name}, pluck="name", order_by="name"
+            )
+            delete_assets(
+                asset_names,
+                chunk_size=asset_delete_chunk_size,
+                commit=commit_asset_chunks,
+            )
 
-        for row in pri:
-            sle_doc = frappe.get_doc(
-                {
-                    "doctype": "Stock Ledger Entry",
-                    "name": make_autoname("SLE-.########"),
-                    "creation": row.posting_date,
-                    "modified": row.posting_date,
-                    "modified_by": row.owner,
-                    "owner": row.owner,
-                    "item_code": row.item_code,
-                    "warehouse": row.warehouse,
-                    "posting_date": row.posting_date,
-                    "posting_time": row.posting_time,
-                    "posting_datetime": f"{row.posting_date} {row.posting_time}",
-                    "actual_qty": row.qty * row.conversion_factor,
-                    "voucher_type": "Purchase Receipt",
-                    "voucher_no": row.parent,
-                    "voucher_detail_no": row.name,
-                    "incoming_rate": row.valuation_rate,
-                    "outgoing_rate": 0,
-                    "company": row.company,
-                    "stock_uom": row.stock_uom,
-                    "batch_no": row.batch_no,
-                    "serial_no": row.serial_no,
-                    "is_cancelled": 0,
-                    "business_category": row.business_category,
-                    "branch": row.branch,
-                    "project": row.project,
-                    "docstatus": row.docstatus,
-                    "qty_after_transaction": 0,
-                    "valuation_rate": 0,
-                    "stock_value": 0,
-                    "stock_value_difference": 0,
-                    "fiscal_year": row.fiscal_year,
-                }
+            # Purchase Receipt Items streamed to the SLE writer
+            affected_postings = insert_stock_ledger_entries(
+                iter_receipt_stock_lines(item_name), names=sle_names
             )
-            sle_doc.insert(ignore_permissions=True)
 
-        # Recalculate stock valuation
-        recalculate_stock_valuation(item_name)
+            # Recalculate stock valuation from the earliest new entry onwards
+            balances = recalculate_stock_valuation(
+                item_name, from_posting=affected_postings
+            )
 
-        # Insert into tabBin
-        bin_rows = frappe.db.sql(
-            """
-            SELECT 
-                pri.item_code, pri.warehouse, pri.stock_uom,
-                SUM(pri.qty * pri.conversion_factor) AS actual_qty,
-                AVG(pri.valuation_rate) AS avg_valuation_rate,
-                SUM(pri.qty * pri.conversion_factor * pri.valuation_rate) AS total_stock_value,
-                pr.owner, pr.posting_date, pr.docstatus
-            FROM `tabPurchase Receipt Item` pri
-            LEFT JOIN `tabPurchase Receipt` pr ON pri.parent = pr.name
-            LEFT JOIN `tabBin` bin ON pri.item_code = bin.item_code AND pri.warehouse = bin.warehouse
-            WHERE pri.item_name = %s AND pri.warehouse IS NOT NULL AND pr.docstatus = 1
-              AND bin.name IS NULL
-            GROUP BY pri.item_code, pri.warehouse
-        """,
-            (item_name,),
-            as_dict=True,
-        )
+            # Create or refresh tabBin from the replayed warehouse balances
+            upsert_bins(item_name, balances, names=bin_names)
 
-        for b in bin_rows:
-            bin_doc = frappe.get_doc(
-                {
-                    "doctype": "Bin",
-                    "name": make_autoname("BIN-.########"),
-                    "creation": b.posting_date,
-                    "modified": b.posting_date,
-                    "modified_by": b.owner,
-                    "owner": b.owner,
-                    "item_code": b.item_code,
-                    "warehouse": b.warehouse,
-                    "stock_uom": b.stock_uom,
-                    "actual_qty": b.actual_qty,
-                    "reserved_qty": 0,
-                    "reserved_qty_for_production": 0,
-                    "reserved_qty_for_sub_contract": 0,
-                    "reserved_qty_for_production_plan": 0,
-                    "reserved_stock": 0,
-                    "indented_qty": 0,
-                    "ordered_qty": 0,
-                    "projected_qty": b.actual_qty,
-                    "valuation_rate": b.avg_valuation_rate,
-                    "stock_value": b.total_stock_value,
-                    "docstatus": b.docstatus,
-                }
-            )
-            bin_doc.insert(ignore_permissions=True)
+            # Logged in the same commit, so a re-run never repeats this stage
+            StageCheckpoint(
+                item_name,
+                ITEM_STAGE_KEY,
+                ITEM_STAGE_KEY,
+                ITEM_STAGE_VOUCHER_TYPE,
+                processed_logs=processed_logs,
+            ).save("Completed")
 
         frappe.db.commit()
         return "✅ Item Operation Successfully Done"
@@ -218,227 +636,550 @@ def update_asset_to_stock_item(item_name):
         frappe.db.sql("SET SQL_SAFE_UPDATES = 1")
 
 
-def recalculate_stock_valuation(item_code):
-    warehouses = frappe.db.get_all(
-        "Stock Ledger Entry",
-        filters={"item_code": item_code, "docstatus": 1},
-        distinct=True,
-        pluck="warehouse",
+@frappe.whitelist()
+def explain_conversion_queries(item_name, asset_account=None):
+    """EXPLAIN the statements a conversion of `item_name` runs.
+
+    Lookups, voucher locks, GL updates and the balance checks are planned
+    against one sample receipt and invoice of the item. Returns one entry
+    per statement with its plan; `full_scan` is set when any table in the
+    plan is read with a full table scan.
+    """
+    frappe.only_for("System Manager")
+
+    sample = frappe.db.get_value(
+        "Purchase Receipt Item",
+        {"item_name": item_name},
+        ["parent", "warehouse"],
+        as_dict=True,
+    ) or frappe._dict()
+    invoice = frappe.db.get_value(
+        "Purchase Invoice Item", {"item_name": item_name}, "parent"
     )
-    for warehouse in warehouses:
-        cum_qty = 0
-        cum_value = 0
-        sle_entries = frappe.get_all(
-            "Stock Ledger Entry",
-            filters={"item_code": item_code, "warehouse": warehouse, "docstatus": 1},
-            fields=[
-                "name",
-                "actual_qty",
-                "incoming_rate",
-                "posting_date",
-                "posting_time",
-            ],
-            order_by="posting_date, posting_time, name",
-        )
-
-        for entry in sle_entries:
-            qty = entry.actual_qty
-            rate = entry.incoming_rate
-            cum_qty += qty
-            cum_value += qty * rate
-
-            valuation_rate = cum_value / cum_qty if cum_qty else 0
-            stock_value = cum_qty * valuation_rate
-            stock_value_diff = stock_value - (cum_value - qty * rate)
+    ledger_params = {
+        "item_code": item_name,
+        "warehouse": sample.warehouse,
+        "posting_date": today(),
+        "posting_time": "00:00:00",
+    }
+    gl_params = {
+        "voucher_nos": (sample.parent,),
+        "accounts": (
+            STOCK_IN_HAND_ACCOUNT,
+            SRBNB_ACCOUNT,
+            asset_account,
+            ARBNB_ACCOUNT,
+        ),
+    }
+    adjust_where = "account = %s AND against = %s"
+    tolerance = 0.5 / 10 ** (frappe.get_precision("GL Entry", "debit") or 2)
 
-            frappe.db.set_value(
-                "Stock Ledger Entry",
-                entry.name,
+    queries = (
+        (
+            "Receipt stock lines",
+            RECEIPT_STOCK_LINES_QUERY,
+            (item_name, item_name, "", RECEIPT_LINE_FETCH_SIZE),
+        ),
+        *(
+            (
+                f"{doctype} snapshot {part}",
+                query.format(doctype=doctype),
+                (item_name,),
+            )
+            for doctype in ("Purchase Receipt", "Purchase Invoice")
+            for part, query in (
+                ("headers", SNAPSHOT_HEADERS_QUERY),
+                ("lines", SNAPSHOT_LINES_QUERY),
+            )
+        ),
+        *(
+            (
+                f"{child_doctype} shared vouchers",
+                SHARED_VOUCHERS_QUERY.format(child_doctype=child_doctype),
+                (item_name,),
+            )
+            for child_doctype in ("Purchase Receipt Item", "Purchase Invoice Item")
+        ),
+        ("GL accounts of vouchers", VOUCHER_GL_ACCOUNTS_QUERY, gl_params),
+        ("GL rows of vouchers", VOUCHER_GL_ROWS_QUERY, gl_params),
+        (
+            "GL update of one voucher",
+            VOUCHER_GL_ADJUST_QUERY.format(
+                column="debit", sign="-", where=adjust_where
+            ),
+            (0, 0, 0, sample.parent, asset_account, ARBNB_ACCOUNT),
+        ),
+        (
+            "GL update of a voucher batch",
+            *gl_adjust_statement(
+                asset_account, ARBNB_ACCOUNT, "debit", [(sample.parent, (0, 0))]
+            ),
+        ),
+        (
+            "Invoice GL against update",
+            INVOICE_AGAINST_UPDATE_QUERY,
+            {"against": "", "voucher_nos": (invoice,)},
+        ),
+        ("Stock ledger tail", STOCK_LEDGER_TAIL_QUERY, ledger_params),
+        ("Previous stock balance", PREVIOUS_STOCK_BALANCE_QUERY, ledger_params),
+        *(
+            (
+                f"{voucher_type} balance check",
+                UNBALANCED_VOUCHERS_QUERY.format(voucher_type=voucher_type),
                 {
-                    "qty_after_transaction": cum_qty,
-                    "valuation_rate": valuation_rate,
-                    "stock_value": stock_value,
-                    "stock_value_difference": stock_value_diff,
+                    "voucher_type": voucher_type,
+                    "item_name": item_name,
+                    "tolerance": tolerance,
                 },
             )
+            for voucher_type in ("Purchase Receipt", "Purchase Invoice")
+        ),
+        (
+            "Stock and GL check",
+            STOCK_GL_MISMATCH_QUERY,
+            {
+                "item_name": item_name,
+                "account": STOCK_IN_HAND_ACCOUNT,
+                "tolerance": tolerance,
+            },
+        ),
+    )
 
+    report = []
+    for label, query, params in queries:
+        plan = frappe.db.sql(f"EXPLAIN {query}", params, as_dict=True)
+        report.append(
+            {
+                "query": label,
+                "full_scan": any(row.type == "ALL" for row in plan),
+                "plan": plan,
+            }
+        )
 
-def update_receipt_gl_convert_asset_to_stock(item_name, asset_category, asset_account):
-    # Check if already processed
-    if frappe.db.exists(
-        "Asset to Stock Processed",
+    return report
+
+
+@frappe.whitelist()
+def verify_conversion_balances(item_name):
+    """Check the ledgers of the vouchers a conversion of `item_name` touched.
+
+    One aggregate query per voucher type lists vouchers whose debits and
+    credits differ in base, account or transaction currency, and one more
+    lists receipts whose stock ledger value differs from their Stock In
+    Hand GL. Conversion accounts missing from the chart of accounts are
+    reported too, since their names are fixed in this module.
+    """
+    frappe.only_for(("Accounts Manager", "System Manager"))
+
+    # Same allowance ERPNext uses when it validates GL debits and credits
+    tolerance = 0.5 / 10 ** (frappe.get_precision("GL Entry", "debit") or 2)
+
+    unbalanced = []
+    for voucher_type in ("Purchase Receipt", "Purchase Invoice"):
+        unbalanced.extend(
+            {"voucher_type": voucher_type, **row}
+            for row in frappe.db.sql(
+                UNBALANCED_VOUCHERS_QUERY.format(voucher_type=voucher_type),
+                {
+                    "voucher_type": voucher_type,
+                    "item_name": item_name,
+                    "tolerance": tolerance,
+                },
+                as_dict=True,
+            )
+        )
+
+    stock_mismatches = frappe.db.sql(
+        STOCK_GL_MISMATCH_QUERY,
         {
             "item_name": item_name,
-            "asset_category": asset_category,
-            "asset_account": asset_account,
-            "voucher_type": "Purchase Receipt",
+            "account": STOCK_IN_HAND_ACCOUNT,
+            "tolerance": tolerance,
         },
+        as_dict=True,
+    )
+
+    accounts = [STOCK_IN_HAND_ACCOUNT, SRBNB_ACCOUNT, ARBNB_ACCOUNT]
+    existing = frappe.get_all(
+        "Account", filters={"name": ["in", accounts]}, pluck="name"
+    )
+    missing_accounts = [account for account in accounts if account not in existing]
+
+    return {
+        "balanced": not (unbalanced or stock_mismatches or missing_accounts),
+        "unbalanced_vouchers": unbalanced,
+        "stock_mismatches": stock_mismatches,
+        "missing_accounts": missing_accounts,
+    }
+
+
+def delete_assets(asset_names, chunk_size=ASSET_DELETE_CHUNK_SIZE, commit=False):
+    """Delete assets and their dependent rows in bounded chunks.
+
+    Assets are handled `chunk_size` at a time, and every dependent table
+    is cleared by primary key in batches of at most `chunk_size` rows, so
+    no statement carries a huge IN list or holds locks for long. With
+    `commit`, the transaction is committed after each chunk of assets.
+    """
+    for start in range(0, len(asset_names), chunk_size):
+        assets = asset_names[start : start + chunk_size]
+
+        for doctype in ASSET_DEPENDENT_DOCTYPES:
+            delete_in_chunks(doctype, {"asset": ["in", assets]}, chunk_size)
+
+        asset_je_filters = {"reference_type": "Asset", "reference_name": ["in", assets]}
+        journal_entries = frappe.get_all(
+            "Journal Entry Account",
+            filters=asset_je_filters,
+            pluck="parent",
+            distinct=True,
+        )
+        delete_in_chunks("Journal Entry Account", asset_je_filters, chunk_size)
+
+        # Delete the Journal Entries left without accounts
+        for je_start in range(0, len(journal_entries), chunk_size):
+            delete_empty_journal_entries(
+                journal_entries[je_start : je_start + chunk_size]
+            )
+
+        delete_in_chunks("Asset", {"name": ["in", assets]}, chunk_size)
+
+        if commit:
+            frappe.db.commit()
+
+
+def delete_in_chunks(doctype, filters, chunk_size):
+    # Delete matching rows by primary key, at most `chunk_size` per statement
+    while names := frappe.get_all(
+        doctype, filters=filters, pluck="name", order_by="name", limit=chunk_size
     ):
-        return _("✅ Already processed.")
+        frappe.db.delete(doctype, {"name": ["in", names]})
 
-    try:
-        frappe.db.begin()
-        frappe.db.sql("SET SQL_SAFE_UPDATES = 0")
 
-        # Get all purchase receipts with the item
-        pr_items = frappe.db.sql(
-            """
-            SELECT 
-                pri.parent, IFNULL(pri.amount, 0) as amount, 
-                IFNULL(pri.base_amount, pri.amount) as base_amount,
-                pri.item_code, pr.posting_date, pr.currency, 
-                pr.owner, pr.business_category, pr.branch, pr.company,pr.currency,pr.cost_center,
-                IFNULL(pr.conversion_rate, 1) as conversion_rate
-            FROM `tabPurchase Receipt Item` pri
-            JOIN `tabPurchase Receipt` pr ON pri.parent = pr.name
-            WHERE pri.item_name = %s AND pri.asset_category = %s
-            AND pr.docstatus = 1
-        """,
-            (item_name, asset_category),
-            as_dict=True,
+def delete_empty_journal_entries(journal_entries):
+    # Only the given headers are checked, not the whole Journal Entry table
+    if not journal_entries:
+        return
+
+    frappe.db.sql(
+        f"""
+        DELETE FROM `tabJournal Entry`
+        WHERE name IN ({", ".join(["%s"] * len(journal_entries))})
+        AND NOT EXISTS (
+            SELECT 1 FROM `tabJournal Entry Account` jea
+            WHERE jea.parent = `tabJournal Entry`.name
         )
+    """,
+        journal_entries,
+    )
+
+
+def iter_receipt_stock_lines(item_name, batch_size=RECEIPT_LINE_FETCH_SIZE):
+    """Yield the item's Purchase Receipt Item rows for SLE creation.
+
+    Rows are fetched `batch_size` at a time, paging on the line name, so
+    memory stays flat however many lines the item has.
+    """
+    last_name = ""
+    while rows := frappe.db.sql(
+        RECEIPT_STOCK_LINES_QUERY,
+        (item_name, item_name, last_name, batch_size),
+        as_dict=True,
+    ):
+        yield from rows
+        last_name = rows[-1].name
+
+
+def insert_stock_ledger_entries(rows, batch_size=SLE_INSERT_BATCH_SIZE, names=None):
+    """Write one Stock Ledger Entry per Purchase Receipt Item row.
+
+    `rows` may be any iterable, including a generator; rows are built
+    lazily and written with multi-row INSERTs of `batch_size` rows,
+    skipping document validation and hooks. The written values match
+    what `frappe.get_doc(...).insert()` stored. Names are drawn from
+    `names`, a SeriesAllocator sized to the row count when it is known.
+
+    Returns the earliest `(posting_date, posting_time)` written per
+    warehouse, for incremental revaluation.
+    """
+    timestamp = now()
+    user = frappe.session.user
+    fiscal_years = get_fiscal_year_index()
+    names = names or SeriesAllocator("SLE-", batch_size)
+    earliest = {}
 
-        for row in pr_items:
-            # Check if GL Entry exists
-            gle_exists = frappe.db.exists(
-                "GL Entry",
-                {"voucher_no": row.parent, "account": "Stock In Hand - AOGC"},
+    def make_values():
+        for row in rows:
+            posting = (row.posting_date, row.posting_time)
+            if row.warehouse not in earliest or posting < earliest[row.warehouse]:
+                earliest[row.warehouse] = posting
+
+            yield (
+                next(names),
+                row.posting_date,
+                timestamp,
+                user,
+                row.owner,
+                row.docstatus,
+                row.item_code,
+                row.warehouse,
+                row.posting_date,
+                row.posting_time,
+                get_datetime(f"{row.posting_date} {row.posting_time}"),
+                row.qty * row.conversion_factor,
+                "Purchase Receipt",
+                row.parent,
+                row.name,
+                row.valuation_rate,
+                0,
+                row.company,
+                row.stock_uom,
+                row.batch_no,
+                row.serial_no,
+                0,
+                row.business_category,
+                row.branch,
+                row.project,
+                0,
+                0,
+                0,
+                0,
+                fiscal_years.get(row.posting_date, row.company),
             )
 
-            # Get fiscal year
-            fiscal_year = frappe.db.get_value(
-                "Fiscal Year",
+    frappe.db.bulk_insert(
+        "Stock Ledger Entry", SLE_FIELDS, make_values(), chunk_size=batch_size
+    )
+
+    return earliest
+
+
+def recalculate_stock_valuation(
+    item_code, from_posting=None, batch_size=SLE_UPDATE_BATCH_SIZE
+):
+    """Replay the item's ledger and store running qty/value on every SLE.
+
+    All entries are read in one query ordered by warehouse and posting
+    time, the running totals are computed per warehouse in a single pass,
+    and the results are written back with batched CASE UPDATEs.
+
+    When `from_posting` maps warehouses to the earliest changed
+    `(posting_date, posting_time)`, only those warehouses are replayed,
+    starting from that point and seeded with the running totals a full
+    replay had after the entry just before it.
+
+    Returns the final `(qty, value)` of every replayed warehouse.
+    """
+    if from_posting is None:
+        sle_entries = frappe.get_all(
+            "Stock Ledger Entry",
+            filters={"item_code": item_code, "docstatus": 1},
+            fields=["name", "warehouse", "actual_qty", "incoming_rate"],
+            order_by="warehouse, posting_date, posting_time, name",
+            as_list=True,
+        )
+        balances = {}
+        updates = revalue_stock_ledger_entries(sle_entries, balances)
+    else:
+        balances = {}
+        updates = []
+        for warehouse, (posting_date, posting_time) in from_posting.items():
+            balances[warehouse] = get_previous_stock_balance(
+                item_code, warehouse, posting_date, posting_time
+            )
+            sle_entries = frappe.db.sql(
+                STOCK_LEDGER_TAIL_QUERY,
                 {
-                    "year_start_date": ["<=", row.posting_date],
-                    "year_end_date": [">=", row.posting_date],
+                    "item_code": item_code,
+                    "warehouse": warehouse,
+                    "posting_date": posting_date,
+                    "posting_time": posting_time,
                 },
-                "name",
             )
+            updates.extend(revalue_stock_ledger_entries(sle_entries, balances))
 
-            if not gle_exists:
-                # Create new GL Entries
-                for account, is_debit in [
-                    ("Stock In Hand - AOGC", True),
-                    ("Stock Received But Not Billed - AOGC", False),
-                ]:
-                    gl_entry = frappe.get_doc(
-                        {
-                            "doctype": "GL Entry",
-                            "posting_date": row.posting_date,
-                            "account": account,
-                            "debit": row.base_amount if is_debit else 0,
-                            "debit_in_account_currency": (
-                                row.base_amount if is_debit else 0
-                            ),
-                            "debit_in_transaction_currency": (
-                                row.amount if is_debit else 0
-                            ),
-                            "credit": 0 if is_debit else row.base_amount,
-                            "credit_in_account_currency": (
-                                0 if is_debit else row.base_amount
-                            ),
-                            "credit_in_transaction_currency": (
-                                0 if is_debit else row.amount
-                            ),
-                            "voucher_no": row.parent,
-                            "voucher_type": "Purchase Receipt",
-                            "voucher_subtype": "Purchase Receipt",
-                            "company": row.company,
-                            "account_currency": row.currency,
-                            "transaction_currency": row.currency,
-                            "transaction_exchange_rate": row.conversion_rate,
-                            "cost_center": row.cost_center,
-                            "remarks": "Accounting Entry for Stock",
-                            "branch": row.branch,
-                            "against": (
-                                "Stock Received But Not Billed - AOGC"
-                                if is_debit
-                                else "Stock In Hand - AOGC"
-                            ),
-                            "fiscal_year": fiscal_year,
-                            "owner": row.owner,
-                            "docstatus": 1,
-                        }
-                    )
-                    gl_entry.insert(ignore_permissions=True)
-            else:
-                # Update existing GL entries
-                frappe.db.sql(
-                    """
-                    UPDATE `tabGL Entry` gle
-                    JOIN `tabPurchase Receipt Item` pri ON gle.voucher_no = pri.parent
-                    SET 
-                        gle.debit = gle.debit + IFNULL(pri.base_amount, pri.amount),
-                        gle.debit_in_account_currency = gle.debit_in_account_currency + IFNULL(pri.base_amount, pri.amount),
-                        gle.debit_in_transaction_currency = gle.debit_in_transaction_currency + IFNULL(pri.amount, 0)
-                    WHERE 
-                        gle.voucher_no = %s 
-                        AND gle.account = 'Stock In Hand - AOGC' 
-                        AND pri.item_code = %s
-                """,
-                    (row.parent, item_name),
-                )
+    for start in range(0, len(updates), batch_size):
+        bulk_set_values(
+            "Stock Ledger Entry",
+            SLE_VALUATION_FIELDS,
+            updates[start : start + batch_size],
+        )
 
-                frappe.db.sql(
-                    """
-                    UPDATE `tabGL Entry` gle
-                    JOIN `tabPurchase Receipt Item` pri ON gle.voucher_no = pri.parent
-                    SET 
-                        gle.credit = gle.credit + IFNULL(pri.base_amount, pri.amount),
-                        gle.credit_in_account_currency = gle.credit_in_account_currency + IFNULL(pri.base_amount, pri.amount),
-                        gle.credit_in_transaction_currency = gle.credit_in_transaction_currency + IFNULL(pri.amount, 0)
-                    WHERE 
-                        gle.voucher_no = %s 
-                        AND gle.account = 'Stock Received But Not Billed - AOGC' 
-                        AND pri.item_code = %s
-                """,
-                    (row.parent, item_name),
-                )
+    return balances
 
-            # Update Asset account side
-            frappe.db.sql(
-                """
-                UPDATE `tabGL Entry` gle
-                JOIN `tabPurchase Receipt Item` pri ON gle.voucher_no = pri.parent
-                SET 
-                    gle.debit = gle.debit - IFNULL(pri.base_amount, pri.amount),
-                    gle.debit_in_account_currency = gle.debit_in_account_currency - IFNULL(pri.base_amount, pri.amount),
-                    gle.debit_in_transaction_currency = gle.debit_in_transaction_currency - IFNULL(pri.amount, 0)
-                WHERE 
-                    gle.account = %s
-                    AND gle.against = 'Asset Received But Not Billed - AOGC'
-                    AND gle.voucher_no = %s
-                    AND pri.item_code = %s
-            """,
-                (asset_account, row.parent, item_name),
-            )
 
-            frappe.db.sql(
-                """
-                UPDATE `tabGL Entry` gle
-                JOIN `tabPurchase Receipt Item` pri ON gle.voucher_no = pri.parent
-                SET 
-                    gle.credit = gle.credit - IFNULL(pri.base_amount, pri.amount),
-                    gle.credit_in_account_currency = gle.credit_in_account_currency - IFNULL(pri.base_amount, pri.amount),
-                    gle.credit_in_transaction_currency = gle.credit_in_transaction_currency - IFNULL(pri.amount, 0)
-                WHERE 
-                    gle.account = 'Asset Received But Not Billed - AOGC'
-                    AND gle.against = %s
-                    AND gle.voucher_no = %s
-                    AND pri.item_code = %s
-            """,
-                (asset_account, row.parent, item_name),
+def upsert_bins(
+    item_code, balances, stock_uom=None, batch_size=BIN_UPSERT_BATCH_SIZE, names=None
+):
+    """Create or refresh the item's Bins from per-warehouse balances.
+
+    `balances` maps warehouse -> (qty, value) as left by the ledger
+    replay. Each batch is one multi-row INSERT ... ON DUPLICATE KEY
+    UPDATE on the Bin's unique (item_code, warehouse) key. Existing Bins
+    keep their reserved and ordered quantities and their projected qty
+    moves by the change in actual qty. Names are drawn from `names`, a
+    SeriesAllocator, when one was reserved ahead.
+    """
+    timestamp = now()
+    user = frappe.session.user
+    stock_uom = stock_uom or frappe.db.get_value("Item", item_code, "stock_uom")
+    names = names or SeriesAllocator("BIN-", len(balances))
+
+    rows = []
+    for warehouse, (qty, value) in sorted(balances.items()):
+        valuation_rate = value / qty if qty else 0
+        rows.append(
+            (
+                next(names),
+                timestamp,
+                timestamp,
+                user,
+                user,
+                item_code,
+                warehouse,
+                stock_uom,
+                qty,
+                *BIN_ZERO_QTY_VALUES,
+                qty,
+                valuation_rate,
+                qty * valuation_rate,
             )
+        )
+
+    columns = ", ".join(f"`{field}`" for field in BIN_FIELDS)
+    placeholders = f"({', '.join(['%s'] * len(BIN_FIELDS))})"
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start : start + batch_size]
+        frappe.db.sql(
+            f"""
+            INSERT INTO `tabBin` ({columns})
+            VALUES {", ".join([placeholders] * len(batch))}
+            ON DUPLICATE KEY UPDATE
+                projected_qty = projected_qty + VALUES(actual_qty) - actual_qty,
+                actual_qty = VALUES(actual_qty),
+                valuation_rate = VALUES(valuation_rate),
+                stock_value = VALUES(stock_value),
+                modified = VALUES(modified),
+                modified_by = VALUES(modified_by)
+        """,
+            [value for row in batch for value in row],
+        )
+
+
+def get_previous_stock_balance(item_code, warehouse, posting_date, posting_time):
+    # Running (qty, value) after the last entry strictly before the posting time
+    previous = frappe.db.sql(
+        PREVIOUS_STOCK_BALANCE_QUERY,
+        {
+            "item_code": item_code,
+            "warehouse": warehouse,
+            "posting_date": posting_date,
+            "posting_time": posting_time,
+        },
+    )
+    return tuple(previous[0]) if previous else (0, 0)
+
+
+def revalue_stock_ledger_entries(sle_entries, running):
+    """Compute running valuation for `(name, warehouse, qty, rate)` rows.
+
+    `running` maps warehouse -> (cum_qty, cum_value) and is updated in
+    place. Returns `(name, values)` pairs ordered like SLE_VALUATION_FIELDS.
+    """
+    updates = []
+    for name, warehouse, qty, rate in sle_entries:
+        cum_qty, cum_value = running.get(warehouse, (0, 0))
+        cum_qty += qty
+        cum_value += qty * rate
+
+        valuation_rate = cum_value / cum_qty if cum_qty else 0
+        stock_value = cum_qty * valuation_rate
+        stock_value_diff = stock_value - (cum_value - qty * rate)
+
+        running[warehouse] = (cum_qty, cum_value)
+        updates.append(
+            (name, (cum_qty, valuation_rate, stock_value, stock_value_diff))
+        )
+
+    return updates
+
+
+def bulk_set_values(doctype, fields, updates):
+    """Set `fields` on many documents with one CASE-based UPDATE.
+
+    `updates` is a list of `(name, values)` pairs where `values` follows
+    the order of `fields`.
+    """
+    if not updates:
+        return
+
+    names = [name for name, _values in updates]
+    assignments = []
+    params = []
+    for idx, field in enumerate(fields):
+        cases = " ".join(["WHEN %s THEN %s"] * len(updates))
+        assignments.append(f"`{field}` = CASE `name` {cases} END")
+        for name, values in updates:
+            params.extend((name, values[idx]))
+
+    params.extend(names)
+    frappe.db.sql(
+        f"""
+        UPDATE `tab{doctype}`
+        SET {", ".join(assignments)}
+        WHERE `name` IN ({", ".join(["%s"] * len(names))})
+    """,
+        params,
+    )
+
+
+def update_receipt_gl_convert_asset_to_stock(
+    item_name,
+    asset_category,
+    asset_account,
+    set_based=False,
+    commit_every=None,
+    processed_logs=None,
+    snapshot=None,
+):
+    # Check if already processed
+    checkpoint = StageCheckpoint(
+        item_name,
+        asset_category,
+        asset_account,
+        "Purchase Receipt",
+        commit_every,
+        processed_logs,
+    )
+    if checkpoint.completed:
+        return _("✅ Already processed.")
+
+    voucher_locks = SharedVoucherLocks("Purchase Receipt Item", item_name)
+    try:
+        frappe.db.begin()
+        frappe.db.sql("SET SQL_SAFE_UPDATES = 0")
+        snapshot = snapshot or ConversionSnapshot(item_name)
+
+        if set_based:
+            voucher_locks.lock_all()
+            rewrite_receipt_gl_set_based(asset_category, asset_account, snapshot)
+        else:
+            # Get all purchase receipts with the item, one row per voucher
+            pr_items = snapshot.receipt_vouchers(asset_category)
+            pr_items = checkpoint.pending_vouchers(pr_items, "parent")
+
+            for rows in voucher_locks.commit_chunks(pr_items, "parent", commit_every):
+                receipt_gl_chunk(rows, asset_account, checkpoint)
 
         # Update PR Items to remove asset reference
         frappe.db.sql(
             """
             UPDATE `tabPurchase Receipt Item`
-            SET 
+            SET
                 is_fixed_asset = 0,
                 asset_category = NULL
-            WHERE 
-                item_code = %s 
+            WHERE
+                item_code = %s
                 AND item_name = %s
                 AND asset_category = %s
         """,
@@ -446,15 +1187,7 @@ def update_receipt_gl_convert_asset_to_stock(item_name, asset_category, asset_ac
         )
 
         # Log the processing
-        frappe.get_doc(
-            {
-                "doctype": "Asset to Stock Processed",
-                "item_name": item_name,
-                "asset_category": asset_category,
-                "asset_account": asset_account,
-                "voucher_type": "Purchase Receipt",
-            }
-        ).insert(ignore_permissions=True)
+        checkpoint.save("Completed")
 
         frappe.db.commit()
         return _("✅ Asset successfully converted to stock item.")
@@ -465,152 +1198,748 @@ def update_receipt_gl_convert_asset_to_stock(item_name, asset_category, asset_ac
         return _("❌ Error occurred: {0}").format(str(e))
 
     finally:
+        voucher_locks.release()
         frappe.db.sql("SET SQL_SAFE_UPDATES = 1")
 
 
-def update_invoice_gl_convert_asset_to_stock(item_name, asset_category, asset_account):
+def receipt_gl_chunk(rows, asset_account, checkpoint):
+    # Per-voucher receipt GL rewrite of one locked commit chunk.
+    # Vouchers that already have a Stock In Hand GL Entry
+    gl_accounts = get_voucher_gl_accounts(
+        [row.parent for row in rows], [STOCK_IN_HAND_ACCOUNT]
+    )
+
+    for row in rows:
+        if (row.parent, STOCK_IN_HAND_ACCOUNT) not in gl_accounts:
+            insert_receipt_stock_gl_entries(row, row.fiscal_year)
+        else:
+            # Update existing GL entries
+            adjust_voucher_gl_entries(
+                row.parent,
+                row,
+                "debit",
+                "+",
+                "account = %s",
+                (STOCK_IN_HAND_ACCOUNT,),
+            )
+            adjust_voucher_gl_entries(
+                row.parent, row, "credit", "+", "account = %s", (SRBNB_ACCOUNT,)
+            )
+
+        # Update Asset account side
+        adjust_voucher_gl_entries(
+            row.parent,
+            row,
+            "debit",
+            "-",
+            "account = %s AND against = %s",
+            (asset_account, ARBNB_ACCOUNT),
+        )
+        adjust_voucher_gl_entries(
+            row.parent,
+            row,
+            "credit",
+            "-",
+            "account = %s AND against = %s",
+            (ARBNB_ACCOUNT, asset_account),
+        )
+
+        checkpoint.voucher_done(row.parent)
+
+
+def update_invoice_gl_convert_asset_to_stock(
+    item_name,
+    asset_category,
+    asset_account,
+    set_based=False,
+    commit_every=None,
+    processed_logs=None,
+    snapshot=None,
+):
+    voucher_locks = SharedVoucherLocks("Purchase Invoice Item", item_name)
     try:
-        if frappe.db.exists(
-            "Asset to Stock Processed",
-            {
-                "item_name": item_name,
-                "asset_category": asset_category,
-                "asset_account": asset_account,
-                "voucher_type": "Purchase Invoice",
-            },
-        ):
+        checkpoint = StageCheckpoint(
+            item_name,
+            asset_category,
+            asset_account,
+            "Purchase Invoice",
+            commit_every,
+            processed_logs,
+        )
+        if checkpoint.completed:
             return "✅ Already processed."
 
         frappe.db.sql("SET SQL_SAFE_UPDATES = 0")
-        processed_items = frappe.db.sql(
-            """
-            SELECT 
-                pini.parent as voucher_no, 
-                IFNULL(pini.amount, 0) as amount, 
-                IFNULL(pini.base_amount, pini.amount) as base_amount,
-                pini.item_code, pin.posting_date, pin.currency, pin.company, pin.cost_center,
-                pin.owner, pin.business_category, pin.branch, 
-                IFNULL(pin.conversion_rate, 1) as conversion_rate,
-                pin.supplier
-            FROM `tabPurchase Invoice Item` pini
-            JOIN `tabPurchase Invoice` pin ON pini.parent = pin.name
-            WHERE pini.item_name = %s
-            AND pin.docstatus = 1
-        """,
-            (item_name,),
-            as_dict=True,
+        snapshot = snapshot or ConversionSnapshot(item_name)
+        if set_based:
+            voucher_locks.lock_all()
+            rewrite_invoice_gl_set_based(snapshot)
+        else:
+            # One row per invoice with the item's amounts summed
+            processed_items = snapshot.invoice_vouchers()
+            processed_items = checkpoint.pending_vouchers(processed_items, "voucher_no")
+
+            for items in voucher_locks.commit_chunks(
+                processed_items, "voucher_no", commit_every
+            ):
+                invoice_gl_chunk(items, checkpoint)
+
+        # Now mark the tracking record as completed
+        checkpoint.save("Completed")
+
+        frappe.db.commit()
+        return "✅ Asset successfully converted to stock item."
+
+    except Exception as e:
+        # Undo the work after the last checkpoint so a re-run can resume
+        frappe.db.rollback()
+        frappe.log_error(frappe.get_traceback(), "Invoice GL Update Error")
+        return f"❌ Error: {str(e)}"
+
+    finally:
+        voucher_locks.release()
+        frappe.db.sql("SET SQL_SAFE_UPDATES = 1")
+
+
+def invoice_gl_chunk(items, checkpoint):
+    # Per-voucher invoice GL rewrite of one locked commit chunk.
+    # Invoices that already have a Stock Received But Not Billed GL Entry
+    gl_accounts = get_voucher_gl_accounts(
+        [item.voucher_no for item in items], [SRBNB_ACCOUNT]
+    )
+
+    for item in items:
+        voucher_no = item.voucher_no
+
+        if (voucher_no, SRBNB_ACCOUNT) not in gl_accounts:
+            insert_invoice_srbnb_gl_entry(item, item.fiscal_year)
+        else:
+            # Update the existing GL Entries
+            adjust_voucher_gl_entries(
+                voucher_no, item, "debit", "+", "account = %s", (SRBNB_ACCOUNT,)
+            )
+
+        # Subtract from 'Asset Received But Not Billed'
+        adjust_voucher_gl_entries(
+            voucher_no, item, "debit", "-", "account = %s", (ARBNB_ACCOUNT,)
         )
 
-        for item in processed_items:
-            voucher_no = item.voucher_no
+        # Update 'against' field
+        frappe.db.sql(
+            INVOICE_AGAINST_UPDATE_QUERY,
+            {
+                "against": f"{ARBNB_ACCOUNT},{SRBNB_ACCOUNT}",
+                "voucher_nos": (voucher_no,),
+            },
+        )
 
-            fiscal_year = frappe.db.get_value(
-                "Fiscal Year",
-                {
-                    "year_start_date": ["<=", item.posting_date],
-                    "year_end_date": [">=", item.posting_date],
-                },
-                "name",
+        checkpoint.voucher_done(voucher_no)
+
+
+class SharedVoucherLocks:
+    """Advisory locks on the item's vouchers that also have lines of other
+    items.
+
+    Parallel jobs converting those other items rewrite the same GL rows.
+    A stage that commits every `commit_every` vouchers only holds the
+    locks of its current chunk, so other lanes wait for one chunk rather
+    than the whole stage; otherwise all shared vouchers are locked until
+    the stage ends. Locks wait VOUCHER_LOCK_TIMEOUT seconds for a lane
+    holding them before the stage fails.
+    """
+
+    def __init__(self, child_doctype, item_name):
+        self.shared = set(
+            frappe.db.sql(
+                SHARED_VOUCHERS_QUERY.format(child_doctype=child_doctype),
+                (item_name,),
+                pluck=True,
             )
+        )
+        self.held = None
+
+    def lock(self, vouchers):
+        # Release the previous chunk's locks, then lock these vouchers
+        self.release()
+        self.held = AdvisoryLocks(
+            [f"voucher:{voucher}" for voucher in vouchers if voucher in self.shared],
+            timeout=VOUCHER_LOCK_TIMEOUT,
+        )
+        self.held.acquire()
+
+    def lock_all(self):
+        self.lock(self.shared)
+
+    def commit_chunks(self, rows, key, commit_every=None):
+        """Yield `rows` in chunks that end where StageCheckpoint commits,
+        each with its vouchers locked. A chunk's locks are released once
+        the next chunk starts, after the commit; the last chunk's are
+        held until `release`, after the stage's final commit."""
+        if not commit_every:
+            self.lock_all()
+            yield rows
+            return
+
+        for start in range(0, len(rows), commit_every):
+            chunk = rows[start : start + commit_every]
+            self.lock(getattr(row, key) for row in chunk)
+            yield chunk
 
-            gle_exists = frappe.db.exists(
-                "GL Entry",
+    def release(self):
+        if self.held:
+            self.held.release()
+            self.held = None
+
+
+def get_voucher_gl_accounts(voucher_nos, accounts, chunk_size=GL_LOOKUP_CHUNK_SIZE):
+    """Return the `(voucher_no, account)` pairs that have a GL Entry.
+
+    Replaces one existence query per voucher with one query per
+    `chunk_size` vouchers.
+    """
+    found = set()
+    for start in range(0, len(voucher_nos), chunk_size):
+        found.update(
+            tuple(pair)
+            for pair in frappe.db.sql(
+                VOUCHER_GL_ACCOUNTS_QUERY,
                 {
-                    "voucher_no": voucher_no,
-                    "account": "Stock Received But Not Billed - AOGC",
+                    "voucher_nos": tuple(voucher_nos[start : start + chunk_size]),
+                    "accounts": tuple(accounts),
                 },
+                as_list=True,
             )
+        )
 
-            if not gle_exists:
-                # Create GL Entry normally (no transaction wrap)
-                gl_entry = frappe.get_doc(
-                    {
-                        "doctype": "GL Entry",
-                        "posting_date": item.posting_date,
-                        "account": "Stock Received But Not Billed - AOGC",
-                        "debit": item.base_amount,
-                        "debit_in_account_currency": item.base_amount,
-                        "debit_in_transaction_currency": item.amount,
-                        "credit": 0,
-                        "voucher_no": voucher_no,
-                        "voucher_type": "Purchase Invoice",
-                        "voucher_subtype": "Purchase Invoice",
-                        "company": item.company,
-                        "account_currency": item.currency,
-                        "transaction_currency": item.currency,
-                        "transaction_exchange_rate": item.conversion_rate,
-                        "cost_center": item.cost_center,
-                        "is_opening": 0,
-                        "is_advance": 0,
-                        "remarks": "Accounting Entry for Stock",
-                        "branch": item.branch,
-                        "owner": item.owner,
-                        "fiscal_year": fiscal_year,
-                        "against": item.supplier,
-                        "docstatus": 1,
-                    }
-                )
-                gl_entry.insert(ignore_permissions=True)
+    return found
 
-            else:
-                # Update the existing GL Entries
-                frappe.db.sql(
-                    """
-                    UPDATE `tabGL Entry` gle
-                    JOIN `tabPurchase Invoice Item` pini ON gle.voucher_no = pini.parent
-                    SET
-                        gle.debit = gle.debit + IFNULL(pini.base_amount, pini.amount),
-                        gle.debit_in_account_currency = gle.debit_in_account_currency + IFNULL(pini.base_amount, pini.amount),
-                        gle.debit_in_transaction_currency = gle.debit_in_transaction_currency + IFNULL(pini.amount, 0)
-                    WHERE gle.voucher_no = %s
-                    AND gle.account = 'Stock Received But Not Billed - AOGC'
-                    AND pini.item_code = %s
-                """,
-                    (voucher_no, item.item_code),
+
+class ProcessedLogs:
+    """Asset to Stock Processed logs of several items, loaded in one query.
+
+    A conversion loads its item's logs once and every stage looks them up
+    in memory. Batch chunks load the logs of all their items up front to
+    skip items that were already converted without locking them.
+    """
+
+    def __init__(self, item_names):
+        self.logs = {}
+        if item_names:
+            for log in frappe.get_all(
+                "Asset to Stock Processed",
+                filters={"item_name": ["in", list(item_names)]},
+                fields=["name", "status", "last_voucher", *PROCESSED_LOG_KEYS],
+            ):
+                self.logs[tuple(log[key] for key in PROCESSED_LOG_KEYS)] = log
+
+        self.items = {key[0] for key in self.logs}
+
+    def __contains__(self, item_name):
+        # Any stage of the item has been logged
+        return item_name in self.items
+
+    def get(self, keys):
+        return self.logs.get(tuple(keys[key] for key in PROCESSED_LOG_KEYS))
+
+    def is_converted(self, item_name, asset_category, asset_account):
+        # Both GL stages completed; a completed log is never reopened
+        for voucher_type in ("Purchase Receipt", "Purchase Invoice"):
+            log = self.logs.get((item_name, asset_category, asset_account, voucher_type))
+            if not log or log.status != "Completed":
+                return False
+        return True
+
+
+class SnapshotRow:
+    """Compact row of a ConversionSnapshot, filled positionally.
+
+    Fields a row doesn't carry itself are read from its `header`.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for field, value in zip(self.__slots__, values):
+            setattr(self, field, value)
+
+    def __getattr__(self, field):
+        # Only reached for fields missing from the row's own slots
+        if field == "header":
+            raise AttributeError(field)
+        return getattr(self.header, field)
+
+
+class VoucherHeader(SnapshotRow):
+    __slots__ = (
+        "name",
+        "posting_date",
+        "posting_time",
+        "owner",
+        "business_category",
+        "branch",
+        "project",
+        "company",
+        "currency",
+        "cost_center",
+        "conversion_rate",
+        "supplier",
+        "docstatus",
+        "fiscal_year",
+    )
+
+
+class VoucherLine(SnapshotRow):
+    __slots__ = (
+        "name",
+        "parent",
+        "item_code",
+        "warehouse",
+        "qty",
+        "conversion_factor",
+        "valuation_rate",
+        "stock_uom",
+        "batch_no",
+        "serial_no",
+        "asset_category",
+        "amount",
+        "base_amount",
+        "header",
+    )
+
+
+class VoucherTotal(SnapshotRow):
+    # The item's amounts on one voucher, summed over its lines
+    __slots__ = ("parent", "item_code", "amount", "base_amount", "header")
+
+    @property
+    def voucher_no(self):
+        return self.parent
+
+
+class ConversionSnapshot:
+    """The item's submitted receipt and invoice lines with their headers.
+
+    Each doctype is read on first use with one query for headers and one
+    for lines, and fiscal years are resolved once per voucher. Both GL
+    stages share one snapshot, so every purchase document is read once
+    per conversion instead of once per stage.
+    """
+
+    def __init__(self, item_name):
+        self.item_name = item_name
+
+    @cached_property
+    def receipt_lines(self):
+        return self.load_lines("Purchase Receipt")
+
+    @cached_property
+    def invoice_lines(self):
+        return self.load_lines("Purchase Invoice")
+
+    def load_lines(self, doctype):
+        fiscal_years = get_fiscal_year_index()
+        headers = {
+            row[0]: VoucherHeader(*row, fiscal_years.get(row[1], row[7]))
+            for row in frappe.db.sql(
+                SNAPSHOT_HEADERS_QUERY.format(doctype=doctype), (self.item_name,)
+            )
+        }
+        return [
+            VoucherLine(*row, headers[row[1]])
+            for row in frappe.db.sql(
+                SNAPSHOT_LINES_QUERY.format(doctype=doctype), (self.item_name,)
+            )
+            if row[1] in headers
+        ]
+
+    def receipt_vouchers(self, asset_category):
+        return self.voucher_totals(
+            line for line in self.receipt_lines if line.asset_category == asset_category
+        )
+
+    def invoice_vouchers(self):
+        return self.voucher_totals(self.invoice_lines)
+
+    @staticmethod
+    def voucher_totals(lines):
+        # One VoucherTotal per voucher, in voucher order
+        totals = {}
+        for line in lines:
+            total = totals.get(line.parent)
+            if total is None:
+                total = totals[line.parent] = VoucherTotal(
+                    line.parent, line.item_code, 0, 0, line.header
                 )
+            total.amount += line.amount
+            total.base_amount += line.base_amount
 
-            # Subtract from 'Asset Received But Not Billed'
-            frappe.db.sql(
-                """
-                UPDATE `tabGL Entry` gle
-                JOIN `tabPurchase Invoice Item` pini ON gle.voucher_no = pini.parent
-                SET
-                    gle.debit_in_account_currency = gle.debit_in_account_currency - IFNULL(pini.base_amount, pini.amount),
-                    gle.debit = gle.debit - IFNULL(pini.base_amount, pini.amount),
-                    gle.debit_in_transaction_currency = gle.debit_in_transaction_currency - IFNULL(pini.amount, 0)
-                WHERE gle.account = 'Asset Received But Not Billed - AOGC'
-                AND gle.voucher_no = %s
-                AND pini.item_code = %s
-            """,
-                (voucher_no, item.item_code),
+        return list(totals.values())
+
+
+class StageCheckpoint:
+    """Progress of one GL stage, kept in its Asset to Stock Processed log.
+
+    With `commit_every`, the stage commits after that many vouchers and
+    records the last one, so a failed run can be resumed from there.
+    """
+
+    def __init__(
+        self,
+        item_name,
+        asset_category,
+        asset_account,
+        voucher_type,
+        commit_every=None,
+        processed_logs=None,
+    ):
+        self.keys = {
+            "item_name": item_name,
+            "asset_category": asset_category,
+            "asset_account": asset_account,
+            "voucher_type": voucher_type,
+        }
+        self.commit_every = commit_every
+        self.pending = 0
+
+        if processed_logs is None:
+            log = frappe.db.get_value(
+                "Asset to Stock Processed",
+                self.keys,
+                ["name", "status", "last_voucher"],
+                as_dict=True,
             )
+        else:
+            log = processed_logs.get(self.keys)
 
-            # Update 'against' field
-            frappe.db.sql(
-                """
-                UPDATE `tabGL Entry`
-                SET against = 'Asset Received But Not Billed - AOGC,Stock Received But Not Billed - AOGC'
-                WHERE voucher_no = %s AND voucher_type = 'Purchase Invoice'
-            """,
-                (voucher_no,),
+        log = log or frappe._dict()
+        self.name = log.name
+        self.completed = log.status == "Completed"
+        self.last_voucher = log.last_voucher
+
+    def pending_vouchers(self, vouchers, key):
+        # Drop the vouchers up to and including the checkpointed one
+        if not self.last_voucher:
+            return vouchers
+
+        for idx, row in enumerate(vouchers):
+            if getattr(row, key) == self.last_voucher:
+                return vouchers[idx + 1 :]
+
+        frappe.throw(
+            _("Checkpoint voucher {0} not found, cannot resume.").format(
+                self.last_voucher
+            )
+        )
+
+    def voucher_done(self, voucher_no):
+        # Commit and checkpoint after every `commit_every` vouchers
+        if not self.commit_every:
+            return
+
+        self.pending += 1
+        if self.pending >= self.commit_every:
+            self.save("In Progress", voucher_no)
+            frappe.db.commit()
+            self.pending = 0
+
+    def save(self, status, last_voucher=None):
+        self.last_voucher = last_voucher or self.last_voucher
+        values = {"status": status, "last_voucher": self.last_voucher}
+
+        if self.name:
+            frappe.db.set_value("Asset to Stock Processed", self.name, values)
+        else:
+            self.name = (
+                frappe.get_doc(
+                    {"doctype": "Asset to Stock Processed", **self.keys, **values}
+                )
+                .insert(ignore_permissions=True)
+                .name
             )
 
-        # Now insert the tracking record (no explicit commit needed)
-        frappe.get_doc(
+
+def insert_receipt_stock_gl_entries(row, fiscal_year):
+    # Stock In Hand / SRBNB pair for a receipt that has no stock GL yet
+    for account, is_debit in [(STOCK_IN_HAND_ACCOUNT, True), (SRBNB_ACCOUNT, False)]:
+        gl_entry = frappe.get_doc(
             {
-                "doctype": "Asset to Stock Processed",
-                "item_name": item_name,
-                "asset_category": asset_category,
-                "asset_account": asset_account,
-                "voucher_type": "Purchase Invoice",
+                "doctype": "GL Entry",
+                "posting_date": row.posting_date,
+                "account": account,
+                "debit": row.base_amount if is_debit else 0,
+                "debit_in_account_currency": row.base_amount if is_debit else 0,
+                "debit_in_transaction_currency": row.amount if is_debit else 0,
+                "credit": 0 if is_debit else row.base_amount,
+                "credit_in_account_currency": 0 if is_debit else row.base_amount,
+                "credit_in_transaction_currency": 0 if is_debit else row.amount,
+                "voucher_no": row.parent,
+                "voucher_type": "Purchase Receipt",
+                "voucher_subtype": "Purchase Receipt",
+                "company": row.company,
+                "account_currency": row.currency,
+                "transaction_currency": row.currency,
+                "transaction_exchange_rate": row.conversion_rate,
+                "cost_center": row.cost_center,
+                "remarks": "Accounting Entry for Stock",
+                "branch": row.branch,
+                "against": SRBNB_ACCOUNT if is_debit else STOCK_IN_HAND_ACCOUNT,
+                "fiscal_year": fiscal_year,
+                "owner": row.owner,
+                "docstatus": 1,
             }
-        ).insert(ignore_permissions=True)
+        )
+        gl_entry.insert(ignore_permissions=True)
 
-        return "✅ Asset successfully converted to stock item."
 
-    except Exception as e:
-        frappe.log_error(frappe.get_traceback(), "Invoice GL Update Error")
-        return f"❌ Error: {str(e)}"
+def insert_invoice_srbnb_gl_entry(item, fiscal_year):
+    # SRBNB debit for an invoice that has no SRBNB GL yet
+    gl_entry = frappe.get_doc(
+        {
+            "doctype": "GL Entry",
+            "posting_date": item.posting_date,
+            "account": SRBNB_ACCOUNT,
+            "debit": item.base_amount,
+            "debit_in_account_currency": item.base_amount,
+            "debit_in_transaction_currency": item.amount,
+            "credit": 0,
+            "voucher_no": item.voucher_no,
+            "voucher_type": "Purchase Invoice",
+            "voucher_subtype": "Purchase Invoice",
+            "company": item.company,
+            "account_currency": item.currency,
+            "transaction_currency": item.currency,
+            "transaction_exchange_rate": item.conversion_rate,
+            "cost_center": item.cost_center,
+            "is_opening": 0,
+            "is_advance": 0,
+            "remarks": "Accounting Entry for Stock",
+            "branch": item.branch,
+            "owner": item.owner,
+            "fiscal_year": fiscal_year,
+            "against": item.supplier,
+            "docstatus": 1,
+        }
+    )
+    gl_entry.insert(ignore_permissions=True)
 
-    finally:
-        frappe.db.sql("SET SQL_SAFE_UPDATES = 1")
+
+def adjust_voucher_gl_entries(voucher_no, row, column, sign, where, params):
+    # Add/subtract one voucher's summed item amounts on one debit or credit side
+    frappe.db.sql(
+        VOUCHER_GL_ADJUST_QUERY.format(column=column, sign=sign, where=where),
+        (row.base_amount, row.base_amount, row.amount, voucher_no, *params),
+    )
+
+
+def rewrite_receipt_gl_set_based(asset_category, asset_account, snapshot):
+    # Receipt GL rewrite from in-memory deltas, one UPDATE per role and batch
+    vouchers = snapshot.receipt_vouchers(asset_category)
+    deltas = GLDeltas(
+        [row.parent for row in vouchers],
+        (STOCK_IN_HAND_ACCOUNT, SRBNB_ACCOUNT, asset_account, ARBNB_ACCOUNT),
+    )
+
+    missing = []
+    for row in vouchers:
+        if deltas.has_account(row.parent, STOCK_IN_HAND_ACCOUNT):
+            deltas.add(row, STOCK_IN_HAND_ACCOUNT, "debit", 1)
+            deltas.add(row, SRBNB_ACCOUNT, "credit", 1)
+        else:
+            # Gets a new Stock In Hand / SRBNB pair
+            deltas.add_new(row, "debit")
+            deltas.add_new(row, "credit")
+            missing.append(row)
+
+        deltas.add(row, asset_account, "debit", -1, against=ARBNB_ACCOUNT)
+        deltas.add(row, ARBNB_ACCOUNT, "credit", -1, against=asset_account)
+
+    deltas.check_balance()
+
+    for row in missing:
+        insert_receipt_stock_gl_entries(row, row.fiscal_year)
+    deltas.write()
+
+
+def rewrite_invoice_gl_set_based(snapshot):
+    # Invoice GL rewrite from in-memory deltas, one UPDATE per role and batch
+    vouchers = snapshot.invoice_vouchers()
+    voucher_nos = [item.voucher_no for item in vouchers]
+    deltas = GLDeltas(voucher_nos, (SRBNB_ACCOUNT, ARBNB_ACCOUNT))
+
+    missing = []
+    for item in vouchers:
+        if deltas.has_account(item.voucher_no, SRBNB_ACCOUNT):
+            deltas.add(item, SRBNB_ACCOUNT, "debit", 1)
+        else:
+            # Gets a new SRBNB debit
+            deltas.add_new(item, "debit")
+            missing.append(item)
+
+        deltas.add(item, ARBNB_ACCOUNT, "debit", -1)
+
+    deltas.check_balance()
+
+    for item in missing:
+        insert_invoice_srbnb_gl_entry(item, item.fiscal_year)
+    deltas.write()
+
+    for start in range(0, len(voucher_nos), GL_DELTA_BATCH_SIZE):
+        frappe.db.sql(
+            INVOICE_AGAINST_UPDATE_QUERY,
+            {
+                "against": f"{ARBNB_ACCOUNT},{SRBNB_ACCOUNT}",
+                "voucher_nos": tuple(voucher_nos[start : start + GL_DELTA_BATCH_SIZE]),
+            },
+        )
+
+
+class GLDeltas:
+    """Per-voucher GL adjustments of one stage, computed in memory.
+
+    A role is the GL rows of a voucher on one account, optionally
+    narrowed to one `against`, and a debit or credit column. Base deltas
+    are rounded to the company currency's precision and transaction
+    deltas to the voucher currency's. `check_balance` verifies
+    that every voucher's debit and credit changes still match, counting
+    the GL rows each UPDATE will actually touch, before `write` issues
+    one CASE UPDATE per role and batch.
+    """
+
+    def __init__(self, voucher_nos, accounts):
+        self.gl_rows = count_voucher_gl_rows(voucher_nos, accounts)
+        self.roles = defaultdict(dict)
+        # voucher_no -> [debit, debit txn currency, credit, credit txn currency]
+        self.totals = defaultdict(lambda: [0, 0, 0, 0])
+        self.currency_precisions = {}
+        self.company_currencies = {}
+        # voucher_no -> (base precision, transaction precision)
+        self.voucher_precisions = {}
+
+    def has_account(self, voucher_no, account):
+        return self.gl_rows[(voucher_no, account)] > 0
+
+    def add(self, row, account, column, sign, against=None):
+        base_amount, amount = self.rounded(row, sign)
+        self.roles[(account, against, column)][row.voucher_no] = (base_amount, amount)
+
+        # Every matching GL row gets the delta
+        if against:
+            matched = self.gl_rows[(row.voucher_no, account, against)]
+        else:
+            matched = self.gl_rows[(row.voucher_no, account)]
+        self.add_to_totals(
+            row.voucher_no, column, base_amount * matched, amount * matched
+        )
+
+    def add_new(self, row, column):
+        # A GL Entry the stage inserts for the voucher
+        self.add_to_totals(row.voucher_no, column, *self.rounded(row, 1))
+
+    def add_to_totals(self, voucher_no, column, base_amount, amount):
+        offset = 0 if column == "debit" else 2
+        totals = self.totals[voucher_no]
+        totals[offset] += base_amount
+        totals[offset + 1] += amount
+
+    def rounded(self, row, sign):
+        # (base_amount, amount) of the voucher, signed and rounded
+        if row.company not in self.company_currencies:
+            self.company_currencies[row.company] = frappe.get_cached_value(
+                "Company", row.company, "default_currency"
+            )
+        base_precision, precision = self.voucher_precisions[row.voucher_no] = (
+            self.currency_precision(self.company_currencies[row.company]),
+            self.currency_precision(row.currency),
+        )
+        return (
+            flt(sign * row.base_amount, base_precision),
+            flt(sign * row.amount, precision),
+        )
+
+    def currency_precision(self, currency):
+        if currency not in self.currency_precisions:
+            self.currency_precisions[currency] = get_field_precision(
+                frappe.get_meta("GL Entry").get_field("debit"), currency=currency
+            )
+        return self.currency_precisions[currency]
+
+    def check_balance(self):
+        unbalanced = []
+        for voucher_no, totals in self.totals.items():
+            debit, debit_amount, credit, credit_amount = totals
+            base_precision, precision = self.voucher_precisions[voucher_no]
+            if flt(debit - credit, base_precision) or flt(
+                debit_amount - credit_amount, precision
+            ):
+                unbalanced.append(voucher_no)
+
+        if unbalanced:
+            frappe.throw(
+                _("GL adjustments would leave vouchers unbalanced: {0}").format(
+                    ", ".join(unbalanced[:20])
+                )
+            )
+
+    def write(self, batch_size=GL_DELTA_BATCH_SIZE):
+        for (account, against, column), deltas in self.roles.items():
+            deltas = list(deltas.items())
+            for start in range(0, len(deltas), batch_size):
+                bulk_adjust_gl_entries(
+                    account, against, column, deltas[start : start + batch_size]
+                )
+
+
+def count_voucher_gl_rows(voucher_nos, accounts, chunk_size=GL_LOOKUP_CHUNK_SIZE):
+    """Count GL Entries per `(voucher_no, account)` and per
+    `(voucher_no, account, against)` for the given vouchers."""
+    gl_rows = Counter()
+    for start in range(0, len(voucher_nos), chunk_size):
+        for voucher_no, account, against, count in frappe.db.sql(
+            VOUCHER_GL_ROWS_QUERY,
+            {
+                "voucher_nos": tuple(voucher_nos[start : start + chunk_size]),
+                "accounts": tuple(accounts),
+            },
+        ):
+            gl_rows[(voucher_no, account)] += count
+            gl_rows[(voucher_no, account, against)] += count
+
+    return gl_rows
+
+
+def bulk_adjust_gl_entries(account, against, column, deltas):
+    """Add `(voucher_no, (base_amount, amount))` deltas to one debit or
+    credit column of the vouchers' GL rows on `account`, with one UPDATE."""
+    frappe.db.sql(*gl_adjust_statement(account, against, column, deltas))
+
+
+def gl_adjust_statement(account, against, column, deltas):
+    # (query, params) of the CASE UPDATE run by bulk_adjust_gl_entries
+    cases = " ".join(["WHEN %s THEN %s"] * len(deltas))
+    base_params = []
+    amount_params = []
+    for voucher_no, (base_amount, amount) in deltas:
+        base_params.extend((voucher_no, base_amount))
+        amount_params.extend((voucher_no, amount))
+
+    where = "account = %s"
+    params = [account]
+    if against:
+        where += " AND against = %s"
+        params.append(against)
+
+    query = f"""
+        UPDATE `tabGL Entry`
+        SET
+            {column} = {column} + CASE voucher_no {cases} END,
+            {column}_in_account_currency = {column}_in_account_currency + CASE voucher_no {cases} END,
+            {column}_in_transaction_currency = {column}_in_transaction_currency + CASE voucher_no {cases} END
+        WHERE voucher_no IN ({", ".join(["%s"] * len(deltas))}) AND {where}
+    """
+    return query, [
+        *base_params,
+        *base_params,
+        *amount_params,
+        *(voucher_no for voucher_no, _delta in deltas),
+        *params,
+    ]
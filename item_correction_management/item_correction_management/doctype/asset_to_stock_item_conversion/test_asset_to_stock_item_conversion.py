@@ -1,9 +1,273 @@
 # Copyright (c) 2025, Ahmad Zubair Amini and Contributors
 # See license.txt
 
-# import frappe
+import frappe
 from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, nowdate
+
+from item_correction_management.item_correction_management.doctype.asset_to_stock_item_conversion.asset_to_stock_item_conversion import (
+	ITEM_STAGE_KEY,
+	ITEM_STAGE_VOUCHER_TYPE,
+	SLE_FIELDS,
+	STOCK_IN_HAND_ACCOUNT,
+	insert_stock_ledger_entries,
+	iter_receipt_stock_lines,
+	recalculate_stock_valuation,
+	update_asset_to_stock_item,
+	update_invoice_gl_convert_asset_to_stock,
+	update_receipt_gl_convert_asset_to_stock,
+	verify_conversion_balances,
+)
+from item_correction_management.tests.conversion_benchmark import SyntheticConversionData
+from item_correction_management.utils import QueryCounter
+
+# Columns that legitimately differ between two writes of the same entry
+AUDIT_FIELDS = ("name", "creation", "modified", "modified_by")
+VALUATION_FIELDS = (
+	"qty_after_transaction",
+	"valuation_rate",
+	"stock_value",
+	"stock_value_difference",
+)
 
 
 class TestAssettoStockItemConversion(FrappeTestCase):
-	pass
+	def make_data(self, lines):
+		# Synthetic asset item with `lines` lines, removed after the test
+		data = SyntheticConversionData(lines, prefix="_Test")
+		data.delete()
+		self.addCleanup(data.delete)
+		data.create()
+		return data
+
+	def get_receipt_sles(self, item_code):
+		return frappe.get_all(
+			"Stock Ledger Entry",
+			filters={"item_code": item_code, "voucher_type": "Purchase Receipt"},
+			fields=[field for field in SLE_FIELDS if field not in AUDIT_FIELDS],
+			order_by="voucher_detail_no",
+		)
+
+	def get_valuations(self, item_code):
+		return {
+			sle.name: tuple(round(sle[field], 6) for field in VALUATION_FIELDS)
+			for sle in frappe.get_all(
+				"Stock Ledger Entry",
+				filters={"item_code": item_code},
+				fields=["name", *VALUATION_FIELDS],
+			)
+		}
+
+	def count_statements(self, lines, stage):
+		# QueryCounter of `stage(data)` on synthetic data with `lines` lines
+		data = SyntheticConversionData(lines, prefix="_Test")
+		data.delete()
+		data.create()
+		try:
+			with QueryCounter() as counter:
+				stage(data)
+		finally:
+			data.delete()
+
+		return counter
+
+	def assertStatementCountFlat(self, stage, rows_proportional=False):
+		# Unmeasured run first, so both measured runs find the fiscal year index
+		# cached and the naming series rows created
+		self.count_statements(20, stage)
+		small = self.count_statements(20, stage)
+		large = self.count_statements(200, stage)
+		self.assertEqual(small.counts, large.counts)
+
+		if rows_proportional:
+			# Ten times the lines touch at most ten times the rows of each kind;
+			# per-stage rows such as the processed log keep it below that
+			for kind in QueryCounter.KINDS:
+				self.assertLessEqual(large.rows[kind], 10 * small.rows[kind], kind)
+			self.assertGreater(sum(large.rows.values()), sum(small.rows.values()))
+
+	def test_set_based_receipt_gl_statement_count_is_flat(self):
+		self.assertStatementCountFlat(
+			lambda data: update_receipt_gl_convert_asset_to_stock(
+				data.item_code, data.asset_category, data.asset_account, set_based=True
+			),
+			rows_proportional=True,
+		)
+
+	def test_set_based_invoice_gl_statement_count_is_flat(self):
+		self.assertStatementCountFlat(
+			lambda data: update_invoice_gl_convert_asset_to_stock(
+				data.item_code, data.asset_category, data.asset_account, set_based=True
+			),
+			rows_proportional=True,
+		)
+
+	def test_revaluation_statement_count_is_flat(self):
+		self.assertStatementCountFlat(
+			lambda data: recalculate_stock_valuation(data.item_code), rows_proportional=True
+		)
+
+	def test_item_stage_statement_count_is_flat(self):
+		# SLE and Bin names come from one reserved series block
+		self.assertStatementCountFlat(lambda data: update_asset_to_stock_item(data.item_code))
+
+	def test_verifier_statement_count_is_flat(self):
+		self.assertStatementCountFlat(lambda data: verify_conversion_balances(data.item_code))
+
+	def test_bulk_stock_ledger_entries_match_per_document_insert(self):
+		data = self.make_data(20)
+		frappe.db.set_value("Item", data.item_code, "is_stock_item", 1)
+		lines = list(iter_receipt_stock_lines(data.item_code))
+
+		insert_stock_ledger_entries(lines)
+		bulk_sles = self.get_receipt_sles(data.item_code)
+		self.assertEqual(len(bulk_sles), len(lines))
+
+		# The same rows inserted as documents, with validation, defaults and the
+		# fiscal year filled in by the Stock Ledger Entry controller
+		frappe.db.delete(
+			"Stock Ledger Entry", {"item_code": data.item_code, "voucher_type": "Purchase Receipt"}
+		)
+		for row in lines:
+			frappe.get_doc(
+				{
+					"doctype": "Stock Ledger Entry",
+					"owner": row.owner,
+					"item_code": row.item_code,
+					"warehouse": row.warehouse,
+					"posting_date": row.posting_date,
+					"posting_time": row.posting_time,
+					"posting_datetime": f"{row.posting_date} {row.posting_time}",
+					"actual_qty": row.qty * row.conversion_factor,
+					"voucher_type": "Purchase Receipt",
+					"voucher_no": row.parent,
+					"voucher_detail_no": row.name,
+					"incoming_rate": row.valuation_rate,
+					"outgoing_rate": 0,
+					"company": row.company,
+					"stock_uom": row.stock_uom,
+					"batch_no": row.batch_no,
+					"serial_no": row.serial_no,
+					"is_cancelled": 0,
+					"business_category": row.business_category,
+					"branch": row.branch,
+					"project": row.project,
+					"docstatus": row.docstatus,
+					"qty_after_transaction": 0,
+					"valuation_rate": 0,
+					"stock_value": 0,
+					"stock_value_difference": 0,
+				}
+			).insert(ignore_permissions=True)
+
+		self.assertEqual(bulk_sles, self.get_receipt_sles(data.item_code))
+
+	def test_incremental_revaluation_matches_full_replay(self):
+		data = self.make_data(20)
+		# Issue the whole history without a rate, so the replay reaches zero qty
+		# while still carrying a value into the new entries
+		frappe.db.bulk_insert(
+			"Stock Ledger Entry",
+			(
+				"name",
+				"item_code",
+				"warehouse",
+				"posting_date",
+				"posting_time",
+				"actual_qty",
+				"incoming_rate",
+				"voucher_type",
+				"voucher_no",
+				"company",
+				"docstatus",
+			),
+			[
+				(
+					f"{data.prefix}-SLE-ISSUE",
+					data.item_code,
+					data.warehouse,
+					add_days(nowdate(), -399),
+					"09:00:00",
+					-frappe.db.count("Stock Ledger Entry", {"item_code": data.item_code}),
+					0,
+					"Stock Entry",
+					f"{data.prefix}-STE-ISSUE",
+					data.company,
+					1,
+				)
+			],
+		)
+
+		# Value the existing history, then let the item stage replay only its tail
+		recalculate_stock_valuation(data.item_code)
+		update_asset_to_stock_item(data.item_code)
+		incremental = self.get_valuations(data.item_code)
+
+		recalculate_stock_valuation(data.item_code)
+		self.assertEqual(incremental, self.get_valuations(data.item_code))
+
+	def test_verifier_reports_unbalanced_vouchers(self):
+		data = self.make_data(20)
+		update_asset_to_stock_item(data.item_code)
+		update_receipt_gl_convert_asset_to_stock(
+			data.item_code, data.asset_category, data.asset_account
+		)
+		unbalanced_receipt = data.voucher_name("Purchase Receipt", 0)
+		mismatched_receipt = data.voucher_name("Purchase Receipt", 1)
+
+		# One-sided GL change on one receipt, stock-only change on another
+		frappe.db.sql(
+			"""
+			UPDATE `tabGL Entry` SET debit = debit + 10
+			WHERE voucher_no = %s AND account = %s
+		""",
+			(unbalanced_receipt, STOCK_IN_HAND_ACCOUNT),
+		)
+		frappe.db.sql(
+			"""
+			UPDATE `tabStock Ledger Entry` SET stock_value_difference = stock_value_difference + 10
+			WHERE voucher_no = %s LIMIT 1
+		""",
+			(mismatched_receipt,),
+		)
+
+		result = verify_conversion_balances(data.item_code)
+		self.assertFalse(result["balanced"])
+		self.assertEqual(
+			{
+				row["voucher_no"]
+				for row in result["unbalanced_vouchers"]
+				if row["voucher_type"] == "Purchase Receipt"
+			},
+			{unbalanced_receipt},
+		)
+		self.assertEqual(
+			{row.voucher_no for row in result["stock_mismatches"]},
+			{unbalanced_receipt, mismatched_receipt},
+		)
+
+	def test_item_stage_logs_one_completed_stage(self):
+		data = self.make_data(20)
+		update_asset_to_stock_item(data.item_code)
+		sle_count = frappe.db.count("Stock Ledger Entry", {"item_code": data.item_code})
+
+		# A re-run finds the log and writes nothing
+		update_asset_to_stock_item(data.item_code)
+		self.assertEqual(
+			frappe.get_all(
+				"Asset to Stock Processed",
+				filters={"item_name": data.item_code},
+				fields=["asset_category", "asset_account", "voucher_type", "status"],
+			),
+			[
+				{
+					"asset_category": ITEM_STAGE_KEY,
+					"asset_account": ITEM_STAGE_KEY,
+					"voucher_type": ITEM_STAGE_VOUCHER_TYPE,
+					"status": "Completed",
+				}
+			],
+		)
+		self.assertEqual(
+			frappe.db.count("Stock Ledger Entry", {"item_code": data.item_code}), sle_count
+		)
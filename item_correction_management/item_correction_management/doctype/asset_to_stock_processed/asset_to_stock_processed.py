@@ -1,9 +1,18 @@
 # Copyright (c) 2025, Ahmad Zubair Amini and contributors
 # For license information, please see license.txt
 
-# import frappe
+import frappe
 from frappe.model.document import Document
 
 
 class AssettoStockProcessed(Document):
 	pass
+
+
+def on_doctype_update():
+	# One log per item, category, account and voucher type
+	frappe.db.add_unique(
+		"Asset to Stock Processed",
+		["item_name", "asset_category", "asset_account", "voucher_type"],
+		constraint_name="unique_conversion_stage",
+	)
@@ -0,0 +1,31 @@
+// Copyright (c) 2025, Ahmad Zubair Amini and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["Asset to Stock Conversion Metrics"] = {
+	filters: [
+		{
+			fieldname: "from_date",
+			label: __("From Date"),
+			fieldtype: "Date",
+			default: frappe.datetime.add_months(frappe.datetime.get_today(), -1),
+		},
+		{
+			fieldname: "to_date",
+			label: __("To Date"),
+			fieldtype: "Date",
+			default: frappe.datetime.get_today(),
+		},
+		{
+			fieldname: "item_name",
+			label: __("Item"),
+			fieldtype: "Link",
+			options: "Item",
+		},
+		{
+			fieldname: "stage",
+			label: __("Stage"),
+			fieldtype: "Select",
+			options: ["", "Item Conversion", "Purchase Receipt GL Updates", "Purchase Invoice GL Updates"],
+		},
+	],
+};
@@ -0,0 +1,143 @@
+# Copyright (c) 2025, Ahmad Zubair Amini and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe import _
+
+
+def execute(filters=None):
+    filters = frappe._dict(filters or {})
+    return get_columns(), get_data(filters)
+
+
+# Documents whose metrics table is reported, with the item of each metric
+METRIC_PARENTS = (
+    ("Asset to Stock Item Conversion", "conv.item_name"),
+    ("Asset to Stock Conversion Batch", "metric.item_name"),
+)
+
+
+def get_columns():
+    return [
+        {
+            "fieldname": "conversion_type",
+            "label": _("Conversion Type"),
+            "fieldtype": "Link",
+            "options": "DocType",
+            "width": 200,
+        },
+        {
+            "fieldname": "conversion",
+            "label": _("Conversion"),
+            "fieldtype": "Dynamic Link",
+            "options": "conversion_type",
+            "width": 120,
+        },
+        {
+            "fieldname": "item_name",
+            "label": _("Item"),
+            "fieldtype": "Link",
+            "options": "Item",
+            "width": 180,
+        },
+        {"fieldname": "stage", "label": _("Stage"), "fieldtype": "Data", "width": 200},
+        {
+            "fieldname": "wall_time",
+            "label": _("Wall Time (s)"),
+            "fieldtype": "Float",
+            "precision": 3,
+            "width": 120,
+        },
+        {
+            "fieldname": "db_time",
+            "label": _("DB Time (s)"),
+            "fieldtype": "Float",
+            "precision": 3,
+            "width": 120,
+        },
+        {
+            "fieldname": "query_count",
+            "label": _("Query Count"),
+            "fieldtype": "Int",
+            "width": 110,
+        },
+        {
+            "fieldname": "rows_inserted",
+            "label": _("Rows Inserted"),
+            "fieldtype": "Int",
+            "width": 110,
+        },
+        {
+            "fieldname": "rows_updated",
+            "label": _("Rows Updated"),
+            "fieldtype": "Int",
+            "width": 110,
+        },
+        {
+            "fieldname": "rows_deleted",
+            "label": _("Rows Deleted"),
+            "fieldtype": "Int",
+            "width": 110,
+        },
+        {
+            "fieldname": "rss_start",
+            "label": _("RSS at Start (MB)"),
+            "fieldtype": "Float",
+            "precision": 2,
+            "width": 140,
+        },
+        {
+            "fieldname": "rss_end",
+            "label": _("RSS at End (MB)"),
+            "fieldtype": "Float",
+            "precision": 2,
+            "width": 140,
+        },
+        {
+            "fieldname": "peak_memory",
+            "label": _("Traced Peak Memory (MB)"),
+            "fieldtype": "Float",
+            "precision": 2,
+            "width": 140,
+        },
+    ]
+
+
+def get_data(filters):
+    # One SELECT per metric parent, so the filters apply to each the same way
+    selects = []
+    for parenttype, item_name in METRIC_PARENTS:
+        conditions = ["conv.docstatus = 1"]
+        if filters.from_date:
+            conditions.append("DATE(conv.modified) >= %(from_date)s")
+        if filters.to_date:
+            conditions.append("DATE(conv.modified) <= %(to_date)s")
+        if filters.item_name:
+            conditions.append(f"{item_name} = %(item_name)s")
+        if filters.stage:
+            conditions.append("metric.stage = %(stage)s")
+
+        selects.append(
+            f"""
+            SELECT
+                '{parenttype}' AS conversion_type, conv.name AS conversion,
+                {item_name} AS item_name, metric.stage,
+                metric.wall_time, metric.db_time, metric.query_count,
+                metric.rows_inserted, metric.rows_updated, metric.rows_deleted,
+                metric.rss_start, metric.rss_end, metric.peak_memory
+            FROM `tab{parenttype}` conv
+            JOIN `tabAsset to Stock Conversion Metric` metric
+                ON metric.parent = conv.name
+                AND metric.parenttype = '{parenttype}'
+            WHERE {" AND ".join(conditions)}
+        """
+        )
+
+    return frappe.db.sql(
+        f"""
+        {" UNION ALL ".join(selects)}
+        ORDER BY wall_time DESC
+    """,
+        filters,
+        as_dict=True,
+    )
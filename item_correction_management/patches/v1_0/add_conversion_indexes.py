@@ -0,0 +1,33 @@
+import frappe
+
+# (doctype, fields, index name) for the asset to stock conversion lookups.
+# The item tables lead with item_name, which every conversion read filters on.
+CONVERSION_INDEXES = (
+    (
+        "Purchase Receipt Item",
+        ["item_name", "item_code", "asset_category"],
+        "item_name_item_code_asset_category_index",
+    ),
+    (
+        "Purchase Invoice Item",
+        ["item_name", "item_code", "asset_category"],
+        "item_name_item_code_asset_category_index",
+    ),
+    (
+        "GL Entry",
+        # `against` is a Text column, so only a prefix can be indexed
+        ["voucher_no", "account", "against(140)"],
+        "voucher_no_account_against_index",
+    ),
+    (
+        "Stock Ledger Entry",
+        ["item_code", "warehouse", "docstatus", "posting_date", "posting_time"],
+        "item_warehouse_docstatus_posting_index",
+    ),
+)
+
+
+def execute():
+    # add_index skips indexes that already exist
+    for doctype, fields, index_name in CONVERSION_INDEXES:
+        frappe.db.add_index(doctype, fields, index_name)
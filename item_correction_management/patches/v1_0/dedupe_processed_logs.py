@@ -0,0 +1,41 @@
+import frappe
+
+PROCESSED_LOG_KEYS = ("item_name", "asset_category", "asset_account", "voucher_type")
+
+
+def execute():
+    # Keep one log per conversion stage so the unique index can be added
+    if not frappe.db.table_exists("Asset to Stock Processed"):
+        return
+
+    keys = ", ".join(PROCESSED_LOG_KEYS)
+    duplicates = frappe.db.sql(
+        f"""
+        SELECT {keys}
+        FROM `tabAsset to Stock Processed`
+        GROUP BY {keys}
+        HAVING COUNT(*) > 1
+    """,
+        as_list=True,
+    )
+
+    # `status` is only added by this release's model sync; before it,
+    # every log was written once its stage had completed
+    order_by = "modified DESC"
+    if frappe.db.has_column("Asset to Stock Processed", "status"):
+        order_by = f"status = 'Completed' DESC, {order_by}"
+
+    match = " AND ".join(f"{key} <=> %s" for key in PROCESSED_LOG_KEYS)
+    for values in duplicates:
+        # Prefer a completed log, then the most recent one
+        names = frappe.db.sql(
+            f"""
+            SELECT name
+            FROM `tabAsset to Stock Processed`
+            WHERE {match}
+            ORDER BY {order_by}
+        """,
+            values,
+            pluck=True,
+        )
+        frappe.db.delete("Asset to Stock Processed", {"name": ["in", names[1:]]})
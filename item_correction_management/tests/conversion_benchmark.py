@@ -0,0 +1,448 @@
+# Copyright (c) 2025, Ahmad Zubair Amini and contributors
+# For license information, please see license.txt
+
+"""Synthetic-data benchmark for the asset to stock conversion pipeline.
+
+Generates asset items with the requested number of receipt/invoice lines
+each, plus the Assets, GL Entries and Stock Ledger Entries that go with
+them, times every conversion stage and removes the data again. Run it on
+a scratch site:
+
+    bench --site <site> execute \\
+        item_correction_management.tests.conversion_benchmark.run \\
+        --kwargs "{'scales': [100, 10000], 'items': 5}"
+"""
+
+import json
+import time
+
+import frappe
+from frappe.utils import add_days, getdate, now, nowdate
+
+from item_correction_management import __version__
+from item_correction_management.item_correction_management.doctype.asset_to_stock_item_conversion.asset_to_stock_item_conversion import (
+    ARBNB_ACCOUNT,
+    SRBNB_ACCOUNT,
+    STOCK_IN_HAND_ACCOUNT,
+    recalculate_stock_valuation,
+    update_asset_to_stock_item,
+    update_invoice_gl_convert_asset_to_stock,
+    update_receipt_gl_convert_asset_to_stock,
+)
+
+DEFAULT_SCALES = (100, 10_000, 100_000)
+LINES_PER_VOUCHER = 4
+ASSETS_PER_VOUCHER = 1
+# Existing ledger entries per receipt line, so revaluation has history
+HISTORY_SLE_RATIO = 0.1
+BENCHMARK_ASSET_ACCOUNT = "Benchmark Fixed Assets - AOGC"
+BENCHMARK_ASSET_CATEGORY = "Benchmark Asset Category"
+
+
+class SyntheticConversionData:
+    """`items` asset items with `lines` receipt and invoice lines each.
+
+    Lines are dealt to the items in turn, so with several items every
+    voucher carries lines of different items. Rows are written with bulk
+    inserts and only carry the columns the conversion reads, so no
+    ERPNext validation runs. Every name starts with `prefix` so `delete`
+    can remove everything again.
+    """
+
+    def __init__(self, lines, prefix="BENCH", items=1):
+        self.lines = lines
+        self.prefix = f"{prefix}-{lines}" if items == 1 else f"{prefix}-{lines}x{items}"
+        self.item_codes = [
+            f"{self.prefix}-ITEM-{idx}" if idx else f"{self.prefix}-ITEM"
+            for idx in range(items)
+        ]
+        # The first item, for callers that use a single one
+        self.item_code = self.item_codes[0]
+        self.asset_category = BENCHMARK_ASSET_CATEGORY
+        self.asset_account = BENCHMARK_ASSET_ACCOUNT
+        self.company = frappe.db.get_single_value(
+            "Global Defaults", "default_company"
+        ) or frappe.db.get_value("Company", {}, "name")
+        self.warehouse = frappe.db.get_value(
+            "Warehouse", {"company": self.company, "is_group": 0}, "name"
+        )
+        self.currency = frappe.get_cached_value(
+            "Company", self.company, "default_currency"
+        )
+        self.cost_center = frappe.get_cached_value(
+            "Company", self.company, "cost_center"
+        )
+        self.vouchers = max(1, lines * items // LINES_PER_VOUCHER)
+
+    def line_item(self, idx):
+        # Item of the idx-th line, asset or history entry
+        return self.item_codes[idx % len(self.item_codes)]
+
+    def voucher_posting_date(self, idx):
+        # Spread vouchers over the year before today
+        return add_days(getdate(nowdate()), -(idx % 365))
+
+    def create(self):
+        timestamp = now()
+        user = frappe.session.user
+
+        frappe.db.bulk_insert(
+            "Item",
+            (
+                "name",
+                "item_code",
+                "item_name",
+                "item_group",
+                "stock_uom",
+                "is_stock_item",
+                "is_fixed_asset",
+                "asset_category",
+                "creation",
+                "modified",
+                "owner",
+                "modified_by",
+            ),
+            [
+                (
+                    item_code,
+                    item_code,
+                    item_code,
+                    "All Item Groups",
+                    "Nos",
+                    0,
+                    1,
+                    self.asset_category,
+                    timestamp,
+                    timestamp,
+                    user,
+                    user,
+                )
+                for item_code in self.item_codes
+            ],
+        )
+
+        frappe.db.bulk_insert(
+            "Asset",
+            ("name", "item_code", "company", "docstatus", "creation", "modified"),
+            (
+                (
+                    f"{self.prefix}-ASSET-{idx}",
+                    self.line_item(idx),
+                    self.company,
+                    1,
+                    timestamp,
+                    timestamp,
+                )
+                for idx in range(self.vouchers * ASSETS_PER_VOUCHER)
+            ),
+        )
+
+        for doctype in ("Purchase Receipt", "Purchase Invoice"):
+            self.create_vouchers(doctype, timestamp, user)
+
+        self.create_history_sles(timestamp, user)
+
+    def voucher_name(self, doctype, idx):
+        abbr = "PR" if doctype == "Purchase Receipt" else "PI"
+        return f"{self.prefix}-{abbr}-{idx}"
+
+    def create_vouchers(self, doctype, timestamp, user):
+        is_receipt = doctype == "Purchase Receipt"
+
+        frappe.db.bulk_insert(
+            doctype,
+            (
+                "name",
+                "posting_date",
+                "posting_time",
+                "company",
+                "currency",
+                "conversion_rate",
+                "cost_center",
+                "owner",
+                "docstatus",
+                "creation",
+                "modified",
+            ),
+            (
+                (
+                    self.voucher_name(doctype, idx),
+                    self.voucher_posting_date(idx),
+                    "10:00:00",
+                    self.company,
+                    self.currency,
+                    1,
+                    self.cost_center,
+                    user,
+                    1,
+                    timestamp,
+                    timestamp,
+                )
+                for idx in range(self.vouchers)
+            ),
+        )
+
+        frappe.db.bulk_insert(
+            f"{doctype} Item",
+            (
+                "name",
+                "parent",
+                "parenttype",
+                "parentfield",
+                "idx",
+                "item_code",
+                "item_name",
+                "asset_category",
+                "is_fixed_asset",
+                "warehouse",
+                "qty",
+                "conversion_factor",
+                "stock_uom",
+                "valuation_rate",
+                "amount",
+                "base_amount",
+            ),
+            (
+                (
+                    f"{self.voucher_name(doctype, idx // LINES_PER_VOUCHER)}-{idx}",
+                    self.voucher_name(doctype, idx // LINES_PER_VOUCHER),
+                    doctype,
+                    "items",
+                    idx % LINES_PER_VOUCHER + 1,
+                    self.line_item(idx),
+                    self.line_item(idx),
+                    self.asset_category,
+                    1,
+                    self.warehouse if is_receipt else None,
+                    1,
+                    1,
+                    "Nos",
+                    100,
+                    100,
+                    100,
+                )
+                for idx in range(self.vouchers * LINES_PER_VOUCHER)
+            ),
+        )
+
+        # GL rows the conversion rewrites, created with zero stock amounts
+        if is_receipt:
+            gl_rows = (
+                (STOCK_IN_HAND_ACCOUNT, SRBNB_ACCOUNT, 0, 0),
+                (SRBNB_ACCOUNT, STOCK_IN_HAND_ACCOUNT, 0, 0),
+                (self.asset_account, ARBNB_ACCOUNT, 400, 0),
+                (ARBNB_ACCOUNT, self.asset_account, 0, 400),
+            )
+        else:
+            gl_rows = (
+                (SRBNB_ACCOUNT, "Benchmark Supplier", 0, 0),
+                (ARBNB_ACCOUNT, "Benchmark Supplier", 400, 0),
+            )
+
+        frappe.db.bulk_insert(
+            "GL Entry",
+            (
+                "name",
+                "voucher_type",
+                "voucher_no",
+                "posting_date",
+                "account",
+                "against",
+                "debit",
+                "debit_in_account_currency",
+                "debit_in_transaction_currency",
+                "credit",
+                "credit_in_account_currency",
+                "credit_in_transaction_currency",
+                "company",
+                "docstatus",
+                "creation",
+                "modified",
+            ),
+            (
+                (
+                    f"{self.voucher_name(doctype, idx)}-GLE-{row_idx}",
+                    doctype,
+                    self.voucher_name(doctype, idx),
+                    self.voucher_posting_date(idx),
+                    account,
+                    against,
+                    debit,
+                    debit,
+                    debit,
+                    credit,
+                    credit,
+                    credit,
+                    self.company,
+                    1,
+                    timestamp,
+                    timestamp,
+                )
+                for idx in range(self.vouchers)
+                for row_idx, (account, against, debit, credit) in enumerate(gl_rows)
+            ),
+        )
+
+    def create_history_sles(self, timestamp, user):
+        # Older ledger entries that revaluation has to replay
+        frappe.db.bulk_insert(
+            "Stock Ledger Entry",
+            (
+                "name",
+                "item_code",
+                "warehouse",
+                "posting_date",
+                "posting_time",
+                "actual_qty",
+                "incoming_rate",
+                "voucher_type",
+                "voucher_no",
+                "company",
+                "docstatus",
+                "creation",
+                "modified",
+                "owner",
+            ),
+            (
+                (
+                    f"{self.prefix}-SLE-{idx}",
+                    self.line_item(idx),
+                    self.warehouse,
+                    add_days(getdate(nowdate()), -400 - idx % 365),
+                    "09:00:00",
+                    1,
+                    90,
+                    "Stock Entry",
+                    f"{self.prefix}-STE-{idx}",
+                    self.company,
+                    1,
+                    timestamp,
+                    timestamp,
+                    user,
+                )
+                for idx in range(
+                    int(self.lines * len(self.item_codes) * HISTORY_SLE_RATIO)
+                )
+            ),
+        )
+
+    def delete(self):
+        like = f"{self.prefix}-%"
+        for doctype in ("Purchase Receipt", "Purchase Invoice"):
+            frappe.db.delete(f"{doctype} Item", {"parent": ["like", like]})
+            frappe.db.delete(doctype, {"name": ["like", like]})
+
+        frappe.db.delete("GL Entry", {"voucher_no": ["like", like]})
+        items = ["in", self.item_codes]
+        frappe.db.delete("Stock Ledger Entry", {"item_code": items})
+        frappe.db.delete("Bin", {"item_code": items})
+        frappe.db.delete("Asset", {"item_code": items})
+        frappe.db.delete("Asset to Stock Processed", {"item_name": items})
+        frappe.db.delete("Item", {"name": items})
+        frappe.db.commit()
+
+
+class StageFailed(Exception):
+    pass
+
+
+def time_stage(timings, stage, fn, *args):
+    # Stage time summed over all items; a "❌" result fails the scale
+    start = time.perf_counter()
+    result = fn(*args)
+    timings[stage] = round(timings.get(stage, 0) + time.perf_counter() - start, 4)
+    if isinstance(result, str) and "❌" in result:
+        raise StageFailed(f"{stage}: {result}")
+    return result
+
+
+def benchmark_scale(lines, items=1):
+    """Create `items` items with `lines` receipt/invoice lines each,
+    convert them and time every stage. The synthetic data is removed
+    afterwards. A failed stage ends the scale and is reported in `error`
+    instead of being timed as a valid run."""
+    data = SyntheticConversionData(lines, items=items)
+    data.delete()
+
+    start = time.perf_counter()
+    data.create()
+    frappe.db.commit()
+    setup_time = round(time.perf_counter() - start, 4)
+
+    timings = {}
+    error = None
+    try:
+        for item_code in data.item_codes:
+            time_stage(
+                timings,
+                "update_asset_to_stock_item",
+                update_asset_to_stock_item,
+                item_code,
+            )
+            # Full ledger replay, on top of the incremental one in the item stage
+            time_stage(
+                timings,
+                "recalculate_stock_valuation",
+                recalculate_stock_valuation,
+                item_code,
+            )
+            frappe.db.commit()
+            time_stage(
+                timings,
+                "update_receipt_gl_convert_asset_to_stock",
+                update_receipt_gl_convert_asset_to_stock,
+                item_code,
+                data.asset_category,
+                data.asset_account,
+            )
+            time_stage(
+                timings,
+                "update_invoice_gl_convert_asset_to_stock",
+                update_invoice_gl_convert_asset_to_stock,
+                item_code,
+                data.asset_category,
+                data.asset_account,
+            )
+            frappe.db.commit()
+
+    except Exception as e:
+        frappe.db.rollback()
+        error = str(e)
+
+    finally:
+        data.delete()
+
+    return {
+        "lines": lines,
+        "items": items,
+        "vouchers": data.vouchers,
+        "setup_time": setup_time,
+        "failed": error is not None,
+        "error": error,
+        "stages": timings,
+        "total_time": round(sum(timings.values()), 4),
+    }
+
+
+def run(scales=DEFAULT_SCALES, items=1, output=None):
+    """Benchmark every scale with `items` items and write the results to
+    `output` as JSON.
+
+    `output` defaults to a timestamped file in the site's private files.
+    Returns the path written.
+    """
+    results = {
+        "app_version": __version__,
+        "timestamp": now(),
+        "scales": [benchmark_scale(int(lines), int(items)) for lines in scales],
+    }
+
+    output = output or frappe.get_site_path(
+        "private",
+        "files",
+        f"conversion_benchmark_{time.strftime('%Y%m%d_%H%M%S')}.json",
+    )
+    with open(output, "w") as f:
+        json.dump(results, f, indent=1)
+
+    return output
@@ -0,0 +1,355 @@
+# Copyright (c) 2025, Ahmad Zubair Amini and contributors
+# For license information, please see license.txt
+
+import hashlib
+import time
+import tracemalloc
+from bisect import bisect_right
+from collections import Counter
+from contextlib import contextmanager
+from itertools import accumulate
+
+import frappe
+import psutil
+from frappe import _
+from frappe.utils import cint, getdate
+
+# Seconds to wait for a named lock held by another job
+ADVISORY_LOCK_TIMEOUT = 60
+ADVISORY_LOCK_BATCH_SIZE = 100
+MB = 1024 * 1024
+
+
+class FiscalYearIndex:
+    """Fiscal years as sorted date intervals per company, resolved with bisect.
+
+    Years without companies apply to every company, as in ERPNext. Years
+    may overlap, so a lookup walks back from the bisect point while an
+    earlier interval can still reach the date, and the latest-starting
+    year that contains it wins.
+    """
+
+    __slots__ = ("intervals",)
+
+    def __init__(self, fiscal_years, companies=()):
+        # `companies` holds (fiscal year, company) rows from Fiscal Year Company
+        year_companies = {}
+        for year, company in companies:
+            year_companies.setdefault(year, []).append(company)
+
+        grouped = {}
+        for name, start, end in fiscal_years:
+            for company in year_companies.get(name) or (None,):
+                grouped.setdefault(company, []).append(
+                    (getdate(start), getdate(end), name)
+                )
+
+        self.intervals = {}
+        for company, years in grouped.items():
+            years.sort()
+            starts, ends, names = zip(*years)
+            self.intervals[company] = (starts, ends, list(accumulate(ends, max)), names)
+
+    def get(self, date, company=None):
+        # Name of the fiscal year containing `date`, or None
+        date = getdate(date)
+        keys = (company, None) if company else self.intervals
+        best = None
+        for key in keys:
+            found = self.find(key, date)
+            if found and (best is None or found > best):
+                best = found
+        return best and best[1]
+
+    def find(self, key, date):
+        if key not in self.intervals:
+            return None
+        starts, ends, max_ends, names = self.intervals[key]
+        idx = bisect_right(starts, date) - 1
+        while idx >= 0 and max_ends[idx] >= date:
+            if ends[idx] >= date:
+                return starts[idx], names[idx]
+            idx -= 1
+
+
+def get_fiscal_year_index():
+    # Loaded once per request/job and kept on frappe.local
+    index = getattr(frappe.local, "fiscal_year_index", None)
+    if index is None:
+        index = frappe.local.fiscal_year_index = FiscalYearIndex(
+            frappe.get_all(
+                "Fiscal Year",
+                filters={"disabled": 0},
+                fields=["name", "year_start_date", "year_end_date"],
+                as_list=True,
+            ),
+            frappe.get_all(
+                "Fiscal Year Company",
+                filters={"parenttype": "Fiscal Year"},
+                fields=["parent", "company"],
+                as_list=True,
+            ),
+        )
+    return index
+
+
+def clear_fiscal_year_index(doc=None, method=None):
+    # Fiscal Year doc_events hook
+    frappe.local.fiscal_year_index = None
+
+
+class QueryCounter:
+    """Record every `frappe.db.sql` statement run while active.
+
+    Statements are counted by kind (SELECT, INSERT, UPDATE, DELETE or
+    OTHER) together with the rows each kind affected and the total time
+    spent in the database.
+
+        with QueryCounter() as counter:
+            update_receipt_gl_convert_asset_to_stock(...)
+        counter.counts["UPDATE"]
+    """
+
+    KINDS = ("SELECT", "INSERT", "UPDATE", "DELETE")
+
+    def __init__(self):
+        self.counts = Counter()
+        self.rows = Counter()
+        self.db_time = 0.0
+        self._sql = None
+
+    @property
+    def total(self):
+        return sum(self.counts.values())
+
+    def __enter__(self):
+        self._sql = frappe.db.sql
+        frappe.db.sql = self._counted_sql
+        return self
+
+    def __exit__(self, *exc):
+        frappe.db.sql = self._sql
+
+    def _counted_sql(self, query, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._sql(query, *args, **kwargs)
+        finally:
+            self.db_time += time.perf_counter() - start
+
+            words = str(query).split(None, 1)
+            kind = words[0].upper() if words else ""
+            kind = kind if kind in self.KINDS else "OTHER"
+            self.counts[kind] += 1
+
+            cursor = getattr(frappe.db, "_cursor", None)
+            if cursor is not None and cursor.rowcount > 0:
+                self.rows[kind] += cursor.rowcount
+
+
+class StageMetrics:
+    """Measure one conversion stage.
+
+    Records wall time, database time, statement count, rows inserted,
+    updated and deleted, and the worker's resident memory when the stage
+    starts and ends. With `trace_memory`, the stage's peak Python
+    allocation is traced with tracemalloc too, which slows every
+    allocation down.
+    """
+
+    def __init__(self, stage, trace_memory=False):
+        self.stage = stage
+        self.trace_memory = trace_memory
+        self.counter = QueryCounter()
+        self.wall_time = 0.0
+        self.rss_start = 0
+        self.rss_end = 0
+        self.peak_memory = None
+        self._process = psutil.Process()
+        self._start = None
+        self._stop_tracing = False
+
+    def __enter__(self):
+        self.rss_start = self._process.memory_info().rss
+        if self.trace_memory:
+            self._stop_tracing = not tracemalloc.is_tracing()
+            if self._stop_tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+
+        self.counter.__enter__()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.wall_time = time.perf_counter() - self._start
+        self.counter.__exit__(*exc)
+
+        self.rss_end = self._process.memory_info().rss
+        if self.trace_memory:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            if self._stop_tracing:
+                tracemalloc.stop()
+
+    def as_dict(self):
+        return {
+            "stage": self.stage,
+            "wall_time": self.wall_time,
+            "db_time": self.counter.db_time,
+            "query_count": self.counter.total,
+            "rows_inserted": self.counter.rows["INSERT"],
+            "rows_updated": self.counter.rows["UPDATE"],
+            "rows_deleted": self.counter.rows["DELETE"],
+            "rss_start": self.rss_start / MB,
+            "rss_end": self.rss_end / MB,
+            "peak_memory": None if self.peak_memory is None else self.peak_memory / MB,
+        }
+
+
+class AdvisoryLocks:
+    """Named database locks (GET_LOCK) for a set of keys.
+
+    Locks belong to the connection, not the transaction, so they survive
+    commits until released. Keys are locked in sorted order, so jobs that
+    lock overlapping sets cannot deadlock each other.
+
+        with AdvisoryLocks([f"item:{item_name}"]):
+            ...
+    """
+
+    def __init__(self, keys, timeout=ADVISORY_LOCK_TIMEOUT):
+        self.keys = sorted(set(keys))
+        self.timeout = timeout
+        self.held = []
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    @staticmethod
+    def lock_name(key):
+        # Lock names are limited to 64 characters
+        return f"icm:{hashlib.sha1(key.encode()).hexdigest()}"
+
+    def acquire(self):
+        for start in range(0, len(self.keys), ADVISORY_LOCK_BATCH_SIZE):
+            keys = self.keys[start : start + ADVISORY_LOCK_BATCH_SIZE]
+            acquired = frappe.db.sql(
+                f"SELECT {', '.join(['GET_LOCK(%s, %s)'] * len(keys))}",
+                [arg for key in keys for arg in (self.lock_name(key), self.timeout)],
+            )[0]
+
+            self.held.extend(key for key, ok in zip(keys, acquired) if ok == 1)
+            if len(self.held) < start + len(keys):
+                locked = next(key for key, ok in zip(keys, acquired) if ok != 1)
+                self.release()
+                frappe.throw(
+                    _("{0} is locked by another conversion job, try again later.").format(
+                        locked
+                    )
+                )
+
+    def release(self):
+        for start in range(0, len(self.held), ADVISORY_LOCK_BATCH_SIZE):
+            keys = self.held[start : start + ADVISORY_LOCK_BATCH_SIZE]
+            frappe.db.sql(
+                f"SELECT {', '.join(['RELEASE_LOCK(%s)'] * len(keys))}",
+                [self.lock_name(key) for key in keys],
+            )
+        self.held = []
+
+
+class SeriesAllocator:
+    """Names of a `PREFIX.########` naming series, reserved in blocks.
+
+    `make_autoname` locks and bumps the `tabSeries` row once per name.
+    This takes the row lock once per `block_size` names, moves the
+    counter past the whole block and hands the names out in memory.
+
+    With `commit`, the first block is reserved and committed right away,
+    so the `tabSeries` row lock is not held while the caller writes. That
+    commit also ends the caller's open transaction, so create the
+    allocator before the first write. Blocks reserved later, because more
+    names were drawn than sized for, stay in the caller's transaction.
+
+        names = SeriesAllocator("SLE-", len(rows), commit=True)
+        next(names)  # "SLE-00000042"
+    """
+
+    __slots__ = ("prefix", "block_size", "digits", "next_number", "last_number")
+
+    def __init__(self, prefix, block_size, digits=8, commit=False):
+        self.prefix = prefix
+        self.block_size = max(block_size, 1)
+        self.digits = digits
+        self.next_number = 1
+        self.last_number = 0
+
+        if commit:
+            self.reserve()
+            frappe.db.commit()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        # Reserve another block if the row count grew since it was sized
+        if self.next_number > self.last_number:
+            self.reserve()
+
+        name = f"{self.prefix}{self.next_number:0{self.digits}d}"
+        self.next_number += 1
+        return name
+
+    def reserve(self):
+        current = frappe.db.sql(
+            "SELECT `current` FROM `tabSeries` WHERE `name` = %s FOR UPDATE",
+            (self.prefix,),
+        )
+        if current:
+            start = current[0][0] or 0
+            frappe.db.sql(
+                "UPDATE `tabSeries` SET `current` = %s WHERE `name` = %s",
+                (start + self.block_size, self.prefix),
+            )
+        else:
+            start = 0
+            frappe.db.sql(
+                "INSERT INTO `tabSeries` (`name`, `current`) VALUES (%s, %s)",
+                (self.prefix, self.block_size),
+            )
+
+        self.next_number = start + 1
+        self.last_number = start + self.block_size
+
+
+@contextmanager
+def allow_update_to_disabled_doc():
+    """Turn on System Settings' `allow_update_to_disabled_doc` for this job.
+
+    The override only replaces the job's `frappe.local.system_settings`,
+    which `frappe.get_system_settings` reads. Nothing is written to the
+    singleton, so there are no commits or cache clears. A failed stage
+    still rolls back cleanly, and parallel jobs cannot switch the
+    setting off under each other.
+    """
+    if cint(frappe.get_system_settings("allow_update_to_disabled_doc")):
+        yield
+        return
+
+    previous = getattr(frappe.local, "system_settings", None)
+    settings = frappe._dict(previous.as_dict() if previous else {})
+    settings.allow_update_to_disabled_doc = 1
+
+    frappe.local.system_settings = settings
+    try:
+        yield
+    finally:
+        if previous is None:
+            # Loaded again from System Settings on the next lookup
+            del frappe.local.system_settings
+        else:
+            frappe.local.system_settings = previous